@@ -29,14 +29,8 @@ class PoissonSolver(PdeConstraint):
         }
 
         self.solution = u
-
-        # problem = fd.NonlinearVariationalProblem(
-        #     self.F, self.solution, bcs=self.bcs)
-        # self.solver = fd.NonlinearVariationalSolver(
-        #     problem, solver_parameters=self.params)
+        self.create_solver()
 
     def solve(self):
         super().solve()
-        fd.solve(self.F == 0, self.solution, bcs=self.bcs,
-                 solver_parameters=self.params)
-        # self.solver.solve()
+        self.run_solver()
@@ -50,17 +50,16 @@ class NavierStokesSolver(PdeConstraint):
             "pc_factor_mat_solver_type": "superlu_dist",
             # "snes_monitor": None, "ksp_monitor": None,
         }
+        self.create_solver()
 
     def solve(self):
         super().solve()
         self.failed_to_solve = False
-        u_old = self.solution.copy(deepcopy=True)
         try:
-            fd.solve(self.F == 0, self.solution, bcs=self.bcs,
-                     solver_parameters=self.params)
+            # restores the last converged state if the solve fails
+            self.run_solver()
         except fd.ConvergenceError:
             self.failed_to_solve = True
-            self.solution.assign(u_old)
 
 
 if __name__ == "__main__":
@@ -7,6 +7,9 @@ import numpy as np
 class PipeObjective(ShapeObjective):
     """L2 tracking functional for Poisson problem."""
 
+    # value_form depends on whether the state solve failed
+    cache_forms = False
+
     def __init__(self, pde_solver: NavierStokesSolver, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.pde_solver = pde_solver
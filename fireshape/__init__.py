@@ -5,3 +5,5 @@ from .objective import *
 from .constraint import *
 from .boundary_extension import *
 from .gmsh_helpers import *
+from .operator_cache import *
+from .lbfgs import *
@@ -1,14 +1,16 @@
 import firedrake as fd
+from .tolerance import inexact_rtol
 
 
 class ElasticityExtension(object):
 
-    def __init__(self, V, fixed_dims=[], direct_solve=False):
+    def __init__(self, V, fixed_dims=[], direct_solve=False, inexact=False):
         if isinstance(fixed_dims, int):
             fixed_dims = [fixed_dims]
         self.V = V
         self.fixed_dims = fixed_dims
         self.direct_solve = direct_solve
+        self.inexact = inexact
         self.zero = fd.Constant(V.mesh().topological_dimension() * (0,))
         u = fd.TrialFunction(V)
         v = fd.TestFunction(V)
@@ -49,6 +51,21 @@ class ElasticityExtension(object):
         # fd.assemble(fd.action(self.a, x), tensor=out)
         out.assign(fd.assemble(fd.action(self.a, x)))
 
+    def set_tolerance(self, tol):
+        """
+        Set the relative tolerance of the iterative solvers to match the
+        accuracy tol requested by ROL (only if inexact=True). If tol is
+        None, the tolerance of get_params is restored.
+        """
+        if not self.inexact or self.direct_solve:
+            return
+        if tol is None:
+            rtol = self.get_params()["ksp_rtol"]
+        else:
+            rtol = inexact_rtol(tol)
+        self.ls_ext.ksp.setTolerances(rtol=rtol)
+        self.ls_adj.ksp.setTolerances(rtol=rtol)
+
     def get_params(self):
         """PETSc parameters to solve linear system."""
         params = {
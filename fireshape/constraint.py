@@ -1,37 +1,146 @@
 import ROL
+import firedrake as fd
+import ufl
+from .objective import Objective, ShapeObjective
 
 
 __all__ = ["EqualityConstraint"]
 
 
 class EqualityConstraint(ROL.Constraint):
+    """
+    Equality constraints c_i(x) = target_value[i] for a list c of
+    objectives.
 
-    def __init__(self, c, target_value=None):
+    The gradients of the c_i are computed once per iterate and reused by
+    applyJacobian and applyAdjointJacobian. They are stored together with
+    the state id of the iterate (see ControlVector.state_id) and discarded
+    when update moves to a different iterate.
+
+    If batched=True and all c_i are shape objectives that only define
+    value_form and derivative_form (with the same quadrature degree), the
+    constraints are evaluated together: their values are assembled in one
+    pass as a vector in R^k, and their derivatives in one pass into a
+    function on the mixed space of k copies of V_m. The Riesz maps of all
+    derivatives are then computed at once (see
+    InnerProduct.riesz_map_multi). Otherwise, the constraints are
+    evaluated one by one.
+    """
+
+    def __init__(self, c, target_value=None, batched=False):
         super().__init__()
+        self.batched = batched and self.can_batch(c)
 
         if target_value is None:
             target_value = [c_.value(None, None) for c_ in c]
         self.target_value = target_value
         self.c = c
+        self.grads = None
+        self.grads_id = None
+        self.grads_tol = None
+
+    def get_gradients(self, x, tol):
+        """Return the gradients of the constraints at x."""
+        # gradients computed with a looser tolerance are recomputed
+        exact = self.grads_tol is None
+        if self.grads_id == x.state_id and \
+                (exact or (tol is not None and self.grads_tol <= tol)):
+            return self.grads
+        if self.grads is None:
+            self.grads = [x.clone() for _ in self.c]
+        if self.batched:
+            self.batch_gradients(self.grads, tol)
+        else:
+            for (c_, g) in zip(self.c, self.grads):
+                c_.gradient(g, x, tol)
+        self.grads_id = x.state_id
+        self.grads_tol = tol
+        return self.grads
+
+    @staticmethod
+    def can_batch(c):
+        """Whether the constraints c can be evaluated together."""
+        for c_ in c:
+            if not isinstance(c_, ShapeObjective) or not c_.cache_forms:
+                return False
+            if type(c_).value is not Objective.value or \
+                    type(c_).derivative is not ShapeObjective.derivative:
+                return False
+            if c_.Q is not c[0].Q or c_.params != c[0].params:
+                return False
+        return True
+
+    def get_batch_forms(self):
+        """
+        Build the forms that evaluate all constraints at once. The value
+        form is tested with a function in R^k, whose i-th component
+        multiplies the integrals of c_i. The derivative form is tested with
+        a function in the mixed space of k copies of V_m, whose i-th
+        component is the direction of the derivative of c_i.
+        """
+        if hasattr(self, "batch_value_form"):
+            return
+        c0 = self.c[0]
+        k = len(self.c)
+        R = fd.VectorFunctionSpace(c0.Q.mesh_m, "R", 0, dim=k)
+        r = fd.TestFunction(R)
+        W = fd.MixedFunctionSpace([c0.V_m] * k)
+        w = fd.TestFunctions(W)
+        integrals = []
+        derivative_forms = []
+        for (i, c_) in enumerate(self.c):
+            for integral in c_.get_value_form().integrals():
+                integrand = c_.scale * r[i] * integral.integrand()
+                integrals.append(integral.reconstruct(integrand=integrand))
+            form = c_.get_derivative_form(c_.V_m)
+            v = form.arguments()[0]
+            derivative_forms.append(c_.scale * ufl.replace(form, {v: w[i]}))
+        self.batch_value_form = ufl.Form(integrals)
+        self.batch_derivative_form = sum(derivative_forms)
+        self.batch_values = fd.Function(R)
+        self.batch_derivs = fd.Function(W)
+        self.batch_derivs_r = [fd.Function(c0.V_r) for _ in self.c]
+
+    def batch_gradients(self, grads, tol):
+        """Compute the gradients of all constraints at once."""
+        self.get_batch_forms()
+        fd.assemble(self.batch_derivative_form, tensor=self.batch_derivs,
+                    form_compiler_parameters=self.c[0].params)
+        subfunctions = self.batch_derivs.split()
+        for (sub, deriv, g) in zip(subfunctions, self.batch_derivs_r, grads):
+            with sub.dat.vec_ro as x, deriv.dat.vec_wo as y:
+                x.copy(y)
+            g.set_tolerance(tol)
+            g.from_first_derivative(deriv)
+        grads[0].inner_product.riesz_map_multi(grads, grads)
+        # the inner product is shared, later Riesz maps are exact
+        grads[0].set_tolerance(None)
+        for g in grads:
+            g.mark_modified()
 
     def value(self, c, x, tol):
+        if self.batched:
+            self.get_batch_forms()
+            fd.assemble(self.batch_value_form, tensor=self.batch_values,
+                        form_compiler_parameters=self.c[0].params)
+            values = self.batch_values.dat.data_ro.reshape(-1)
+        else:
+            values = [c_.value(None, None) for c_ in self.c]
         for i in range(len(self.c)):
-            c[i] = self.c[i].value(None, None) - self.target_value[i]
+            c[i] = values[i] - self.target_value[i]
 
     def applyJacobian(self, jv, v, x, tol):
-        g = v.clone()
+        grads = self.get_gradients(x, tol)
         for i in range(len(self.c)):
-            self.c[i].gradient(g, x, tol)
-            jv[i] = g.dot(v)
+            jv[i] = grads[i].dot(v)
 
     def applyAdjointJacobian(self, ajv, v, x, tol):
+        grads = self.get_gradients(x, tol)
         ajv.scale(0.0)
-        g = ajv.clone()
-        for i in range(len(self.c)):
-            self.c[i].gradient(g, x, tol)
-            g.scale(v[i])
-            ajv.plus(g)
+        ajv.maxpy([v[i] for i in range(len(self.c))], grads)
 
     def update(self, x, flag, iteration):
+        if x.state_id != self.grads_id:
+            self.grads_id = None
         for c_ in self.c:
             c_.update(x, flag, iteration)
@@ -8,8 +8,9 @@ __all__ = ["FeControlSpace", "FeMultiGridControlSpace",
 # new imports for splines
 from firedrake.petsc import PETSc
 from functools import reduce
-from scipy.interpolate import splev
 import numpy as np
+import weakref
+import itertools
 
 
 class ControlSpace(object):
@@ -42,7 +43,8 @@ class ControlSpace(object):
         Input:
         residual: fd.Function, is a variable in the dual of self.V_r
         out: ControlVector, is a variable in the dual of ControlSpace
-             (overwritten with result)
+             (overwritten with result through out.vec_wo(), so that its
+             cached dual is invalidated)
         """
 
         raise NotImplementedError
@@ -67,20 +69,12 @@ class ControlSpace(object):
         # Check if the new control is different from the last one.  ROL is
         # sometimes a bit strange in that it calls update on the same value
         # more than once, in that case we don't want to solve the PDE over
-        # again.
+        # again. Controls with the same state id have the same content
+        # (see ControlVector.state_id).
 
-        if not hasattr(self, 'lastq') or self.lastq is None:
-            self.lastq = q.clone()
-            self.lastq.set(q)
-        else:
-            self.lastq.axpy(-1., q)
-            # calculate l2 norm (faster)
-            diff = self.lastq.vec_ro().norm()
-            self.lastq.axpy(+1., q)
-            if diff < 1e-20:
-                return False
-            else:
-                self.lastq.set(q)
+        if getattr(self, "last_state_id", None) == q.state_id:
+            return False
+        self.last_state_id = q.state_id
         q.to_coordinatefield(self.T)
         self.T += self.id
         return True
@@ -95,6 +89,15 @@ class ControlSpace(object):
 
         raise NotImplementedError
 
+    def get_vector_pool(self):
+        """
+        Return the VectorPool that recycles the data of ControlVectors
+        created by ControlVector.clone.
+        """
+        if not hasattr(self, "vector_pool"):
+            self.vector_pool = VectorPool(self.get_zero_vec)
+        return self.vector_pool
+
     def assign_inner_product(self, inner_product):
         """
         create self.inner_product
@@ -109,6 +112,15 @@ class ControlSpace(object):
         """
         raise NotImplementedError
 
+    def get_prolongations_for_inner(self):
+        """
+        return the prolongation matrices between the levels of a mesh
+        hierarchy whose finest level is the mesh of the functionspace
+        returned by get_space_for_inner, ordered from coarse to fine.
+        These are used to solve the Riesz map with geometric multigrid.
+        """
+        raise NotImplementedError
+
     def store(self, vec, filename):
         """
         Store the vector to a file to be reused in a later computation
@@ -140,9 +152,8 @@ class FeControlSpace(ControlSpace):
         self.V_m = fd.FunctionSpace(self.mesh_m, element)
 
     def restrict(self, residual, out):
-        with residual.dat.vec as vecres:
-            with out.fun.dat.vec as vecout:
-                vecres.copy(vecout)
+        with residual.dat.vec_ro as vecres:
+            vecres.copy(out.vec_wo())
 
     def interpolate(self, vector, out):
         out.assign(vector.fun)
@@ -173,6 +184,7 @@ class FeControlSpace(ControlSpace):
         """
         with fd.DumbCheckpoint(filename, mode=fd.FILE_READ) as chk:
             chk.load(vec.fun, name=filename)
+        vec.mark_modified()
 
 
 class FeMultiGridControlSpace(ControlSpace):
@@ -188,28 +200,36 @@ class FeMultiGridControlSpace(ControlSpace):
         refinements: type int, number of uniform refinements to perform
                      to obtain the StateSpace mesh.
         order: type int, order of Lagrange basis functions of ControlSpace.
+        control_level: type int, level of the mesh hierarchy on which the
+                       ControlSpace is constructed (default: the coarsest).
+                       The levels below it are used by inner products
+                       that solve the Riesz map with geometric multigrid,
+                       which therefore requires control_level > 0.
+
+    The prolongation from the control level to the finest mesh is assembled
+    once as a sparse matrix self.P, so that interpolate and restrict are a
+    single (transposed) matrix-vector product.
 
     Note: as of 04.03.2018, 3D is not supported by fd.MeshHierarchy.
     """
 
-    def __init__(self, mesh_r, refinements=1, order=1):
+    def __init__(self, mesh_r, refinements=1, order=1, control_level=0):
         mh = fd.MeshHierarchy(mesh_r, refinements)
         self.mesh_hierarchy = mh
-
-        # Control space on coarsest mesh
-        self.mesh_r_coarse = self.mesh_hierarchy[0]
+        self.order = order
+        if not 0 <= control_level <= refinements:
+            raise ValueError("control_level must be between 0 and "
+                             "refinements.")
+        self.control_level = control_level
+
+        # Control space on level control_level of the hierarchy
+        self.mesh_r_coarse = self.mesh_hierarchy[control_level]
         self.V_r_coarse = fd.VectorFunctionSpace(self.mesh_r_coarse, "CG",
                                                  order)
 
         # Create self.id and self.T on refined mesh.
         element = self.V_r_coarse.ufl_element()
 
-        self.intermediate_Ts = []
-        for i in range(refinements - 1):
-            mesh = self.mesh_hierarchy[i + 1]
-            V = fd.FunctionSpace(mesh, element)
-            self.intermediate_Ts.append(fd.Function(V))
-
         self.mesh_r = self.mesh_hierarchy[-1]
         element = self.V_r_coarse.ufl_element()
         self.V_r = fd.FunctionSpace(self.mesh_r, element)
@@ -221,19 +241,77 @@ class FeMultiGridControlSpace(ControlSpace):
         self.mesh_m = fd.Mesh(self.T)
         self.V_m = fd.FunctionSpace(self.mesh_m, element)
 
+        self.P = self.build_prolongation_matrix(control_level, refinements)
+
+    def build_prolongation_matrix(self, coarse, fine):
+        """
+        Assemble the prolongation from level coarse to level fine of
+        self.mesh_hierarchy for vectorial Lagrange finite elements.
+
+        The meshes are nested, so the prolongation is the interpolation of
+        the coarse basis functions in the fine nodes. These are evaluated
+        by locating every fine node in a coarse cell (following the
+        fine-to-coarse cell maps of the hierarchy) and tabulating the
+        coarse finite element at the corresponding reference coordinates.
+        """
+        mesh_c = self.mesh_hierarchy[coarse]
+        mesh_f = self.mesh_hierarchy[fine]
+        assert mesh_c.ufl_cell().is_simplex()
+        Vc = fd.FunctionSpace(mesh_c, "CG", self.order)
+        Vf = fd.FunctionSpace(mesh_f, "CG", self.order)
+
+        # coordinates of the owned fine nodes
+        Xf = fd.VectorFunctionSpace(mesh_f, "CG", self.order)
+        x = fd.interpolate(fd.SpatialCoordinate(mesh_f), Xf).dat.data_ro
+        (nf, d) = x.shape
+
+        # a fine cell (and then a coarse cell) that contains each fine node
+        cell_nodes = Vf.cell_node_list
+        cells = np.zeros(Vf.node_set.total_size, dtype=int)
+        cells[cell_nodes.reshape(-1)] = np.repeat(np.arange(len(cell_nodes)),
+                                                  cell_nodes.shape[1])
+        cells = cells[:nf]
+        for level in range(fine, coarse, -1):
+            fine_to_coarse = np.asarray(
+                self.mesh_hierarchy.fine_to_coarse_cells[level])
+            cells = fine_to_coarse.reshape(len(fine_to_coarse), -1)[cells, 0]
+
+        coords = mesh_c.coordinates
+        assert coords.ufl_element().degree() == 1
+        vertices = coords.dat.data_ro_with_halos[
+            coords.function_space().cell_node_list[cells]]
+        vals = evaluate_basis_in_cells(Vc.finat_element.fiat_equivalent,
+                                       vertices, x)
+        cols = Vc.dof_dset.lgmap.apply(
+            Vc.cell_node_list[cells].reshape(-1)).reshape(vals.shape)
+        order = np.argsort(cols, axis=1)
+        cols = np.take_along_axis(cols, order, axis=1)
+        vals = np.take_along_axis(vals, order, axis=1)
+
+        # blow up to vector fields, whose components are interleaved
+        cols = d * cols[:, None, :] + np.arange(d)[None, :, None]
+        vals = np.broadcast_to(vals[:, None, :], cols.shape)
+        mask = abs(vals) > 1e-12
+        indptr = np.zeros(nf * d + 1, dtype=PETSc.IntType)
+        np.cumsum(mask.sum(axis=2).reshape(-1), out=indptr[1:])
+
+        fun_c = fd.Function(fd.FunctionSpace(mesh_c, Xf.ufl_element()))
+        fun_f = fd.Function(Xf)
+        sizes = ((fun_f.vector().local_size(), fun_f.vector().size()),
+                 (fun_c.vector().local_size(), fun_c.vector().size()))
+        P = PETSc.Mat().createAIJ(
+            sizes, csr=(indptr, cols[mask].astype(PETSc.IntType), vals[mask]),
+            comm=mesh_f.mpi_comm())
+        P.assemble()
+        return P
+
     def restrict(self, residual, out):
-        Tf = residual
-        for Tinter in reversed(self.intermediate_Ts):
-            fd.restrict(Tf, Tinter)
-            Tf = Tinter
-        fd.restrict(Tf, out.fun)
+        with residual.dat.vec_ro as w:
+            self.P.multTranspose(w, out.vec_wo())
 
     def interpolate(self, vector, out):
-        Tc = vector.fun
-        for Tinter in self.intermediate_Ts:
-            fd.prolong(Tc, Tinter)
-            Tc = Tinter
-        fd.prolong(Tc, out)
+        with out.dat.vec_wo as w:
+            self.P.mult(vector.vec_ro(), w)
 
     def get_zero_vec(self):
         fun = fd.Function(self.V_r_coarse)
@@ -243,6 +321,10 @@ class FeMultiGridControlSpace(ControlSpace):
     def get_space_for_inner(self):
         return (self.V_r_coarse, None)
 
+    def get_prolongations_for_inner(self):
+        return [self.build_prolongation_matrix(level - 1, level)
+                for level in range(1, self.control_level + 1)]
+
     def store(self, vec, filename="control"):
         """
         Store the vector to a file to be reused in a later computation.
@@ -261,13 +343,30 @@ class FeMultiGridControlSpace(ControlSpace):
         """
         with fd.DumbCheckpoint(filename, mode=fd.FILE_READ) as chk:
             chk.load(vec.fun, name=filename)
+        vec.mark_modified()
+
+
+def evaluate_basis_in_cells(fiat_element, vertices, x):
+    """
+    Evaluate the basis functions of a FIAT element on affine simplices.
+
+    vertices: array of shape (npoints, tdim+1, gdim) with the vertices of
+              the cell that contains each point
+    x: array of shape (npoints, gdim)
+
+    Returns an array of shape (npoints, space dimension of fiat_element).
+    """
+    J = (vertices[:, 1:, :] - vertices[:, :1, :]).transpose(0, 2, 1)
+    X = np.linalg.solve(J, (x - vertices[:, 0, :])[..., None])[..., 0]
+    tdim = X.shape[1]
+    return fiat_element.tabulate(0, X)[(0,) * tdim].T
 
 
 class BsplineControlSpace(ControlSpace):
     """ConstrolSpace based on cartesian tensorized Bsplines."""
 
     def __init__(self, mesh, bbox, orders, levels, fixed_dims=[],
-                 boundary_regularities=None):
+                 boundary_regularities=None, matfree=False, cache=None):
         """
         bbox: a list of tuples describing [(xmin, xmax), (ymin, ymax), ...]
               of a Cartesian grid that extends around the shape to be
@@ -287,6 +386,14 @@ class BsplineControlSpace(ControlSpace):
                                [0,..,0] : they don't go to zero
                                [1,..,1] : they go to zero with C^0 regularity
                                [2,..,2] : they go to zero with C^1 regularity
+
+        matfree: if True, self.FullIFW is not assembled. Instead, its
+                 action is computed on the fly from the univariate
+                 B-splines (see SumFactorizedInterpolation).
+
+        cache: a fireshape.OperatorCache. If provided, the interpolation
+               matrices are loaded from it (if they have been stored for
+               the same mesh and parameters) or stored in it.
         """
         self.boundary_regularities = [o - 1 for o in orders] \
             if boundary_regularities is None else boundary_regularities
@@ -298,8 +405,14 @@ class BsplineControlSpace(ControlSpace):
         if isinstance(fixed_dims, int):
             fixed_dims = [fixed_dims]
         self.fixed_dims = fixed_dims
+        self.matfree = matfree
         self.construct_knots()
         self.comm = mesh.mpi_comm()
+        self.cache = cache
+        if cache is not None:
+            self.cache_key = cache.key(mesh, type(self).__name__, bbox,
+                                       orders, levels, fixed_dims,
+                                       self.boundary_regularities)
         # create temporary self.mesh_r and self.V_r to assemble innerproduct
         if self.dim == 2:
             nx = len(self.knots[0]) - 1
@@ -336,7 +449,8 @@ class BsplineControlSpace(ControlSpace):
 
         # is this the proper space?
         self.V_control = fd.VectorFunctionSpace(self.mesh_r, "CG", maxdegree)
-        self.I_control = self.build_interpolation_matrix(self.V_control)
+        self.I_control = self.get_interpolation_matrix(self.V_control,
+                                                       "I_control")
 
         # standard construction of ControlSpace
         self.mesh_r = mesh
@@ -351,8 +465,13 @@ class BsplineControlSpace(ControlSpace):
 
         assert self.dim == self.mesh_r.geometric_dimension()
 
-        # assemble correct interpolation matrix
-        self.FullIFW = self.build_interpolation_matrix(self.V_r)
+        # assemble correct interpolation matrix. Only the scalar matrix
+        # IFW is built, FullIFW applies it to every free component.
+        if self.matfree:
+            self.FullIFW = self.build_matfree_interpolation_matrix(self.V_r)
+        else:
+            IFW = self.get_interpolation_matrix(self.V_r, "IFW", scalar=True)
+            self.FullIFW = self.build_block_interpolation_matrix(IFW)
 
     def construct_knots(self):
         """
@@ -393,6 +512,39 @@ class BsplineControlSpace(ControlSpace):
         N = reduce(lambda x, y: x * y, self.n)
         self.N = N
 
+    def get_interpolation_matrix(self, V, name, scalar=False):
+        """
+        Load the interpolation matrix into V (or into its scalar subspace,
+        if scalar=True) from self.cache or, if it is not there, build it
+        (and store it in self.cache).
+        """
+        if scalar:
+            build = self.build_scalar_interpolation_matrix
+        else:
+            build = self.build_interpolation_matrix
+        if self.cache is None:
+            return build(V)
+
+        sizes = self.interpolation_matrix_sizes(V, scalar)
+        I = self.cache.load_mat(self.cache_key, name, sizes, self.comm)
+        if I is None:
+            I = build(V)
+            self.cache.store_mat(self.cache_key, name, I)
+        return I
+
+    def interpolation_matrix_sizes(self, V, scalar=False):
+        """Local and global sizes of the interpolation matrix into V."""
+        fun = fd.Function(V)
+        lsize = fun.vector().local_size()
+        gsize = fun.vector().size()
+
+        comm = self.comm
+        local_N = self.N // comm.size + int(comm.rank < (self.N % comm.size))
+        if scalar:
+            return ((lsize // self.dim, gsize // self.dim), (local_N, self.N))
+        dfree = len(set(range(self.dim)) - set(self.fixed_dims))
+        return ((lsize, gsize), (dfree * local_N, dfree * self.N))
+
     def build_interpolation_matrix(self, V):
         """
         Construct the matrix self.FullIFW.
@@ -400,14 +552,78 @@ class BsplineControlSpace(ControlSpace):
         The columns of self.FullIFW are the interpolant
         of (vectorial tensorized) Bsplines into V
         """
+        IFW = self.build_scalar_interpolation_matrix(V)
+        # interleave self.dim-many IFW matrices among each other
+        return self.construct_full_interpolation_matrix(IFW)
+
+    def build_scalar_interpolation_matrix(self, V):
+        """
+        Construct the matrix IFW, whose columns are the interpolant of the
+        scalar tensorized Bsplines into V.sub(0).
+        """
         # construct list of scalar univariate interpolation matrices
         interp_1d = self.construct_1d_interpolation_matrices(V)
         # construct scalar tensorial interpolation matrix
-        self.IFWnnz = 0  # to compute sparsity pattern in parallel
-        IFW = self.construct_kronecker_matrix(interp_1d)
-        # interleave self.dim-many IFW matrices among each other
-        self.FullIFWnnz = 0  # to compute sparsity pattern in parallel
-        return self.construct_full_interpolation_matrix(IFW)
+        return self.construct_kronecker_matrix(interp_1d)
+
+    def build_block_interpolation_matrix(self, IFW):
+        """
+        Construct a matrix with the same action as the matrix returned by
+        self.construct_full_interpolation_matrix(IFW).
+
+        If no dimensions are fixed, this is a BAIJ matrix with block size
+        self.dim, whose blocks are the entries of IFW times the identity,
+        so that all components are interpolated by one blocked product.
+        Otherwise, it is a PETSc shell matrix that applies IFW to every
+        free component (see BlockInterpolation).
+        """
+        ((lsize, gsize), (lsize_spline, gsize_spline)) = IFW.getSizes()
+        d = self.dim
+        dfree = len(set(range(self.dim)) - set(self.fixed_dims))
+        if dfree == d:
+            (indptr, indices, data) = IFW.getValuesCSR()
+            blocks = data[:, None, None] * np.eye(d)[None, :, :]
+            FullIFW = PETSc.Mat().createBAIJ(
+                ((d * lsize, d * gsize), (d * lsize_spline, d * gsize_spline)),
+                d, csr=(indptr, indices, blocks.reshape(-1)), comm=self.comm)
+            FullIFW.assemble()
+            return FullIFW
+        sizes = ((d * lsize, d * gsize),
+                 (dfree * lsize_spline, dfree * gsize_spline))
+        ctx = BlockInterpolation(IFW, self.dim, self.fixed_dims)
+        FullIFW = PETSc.Mat().createPython(sizes, ctx, comm=self.comm)
+        FullIFW.setUp()
+        return FullIFW
+
+    def build_matfree_interpolation_matrix(self, V):
+        """
+        Construct a PETSc shell matrix with the same action as the
+        matrix returned by self.build_interpolation_matrix(V).
+        """
+        factors_1d = self.evaluate_1d_factors(V)
+        sizes = self.interpolation_matrix_sizes(V)
+        ctx = SumFactorizedInterpolation(factors_1d, self.n, self.dim,
+                                         self.fixed_dims)
+        FullIFW = PETSc.Mat().createPython(sizes, ctx, comm=self.comm)
+        FullIFW.setUp()
+        return FullIFW
+
+    def evaluate_1d_factors(self, V):
+        """
+        Evaluate the univariate B-splines on the owned dofs of V.sub(0).
+
+        Returns a list with one tuple (cols, vals) per geometric dimension,
+        see self.evaluate_univariate_bsplines. This also sets self.M, the
+        dimension of V.sub(0).
+        """
+        x_fct = fd.SpatialCoordinate(self.mesh_r)
+        factors_1d = []
+        for dim in range(self.dim):
+            x_int = fd.interpolate(x_fct[dim], V.sub(0))
+            x = x_int.vector().get_local()
+            factors_1d.append(self.evaluate_univariate_bsplines(x, dim))
+        self.M = x_int.vector().size()
+        return factors_1d
 
     def construct_1d_interpolation_matrices(self, V):
         """
@@ -421,59 +637,85 @@ class BsplineControlSpace(ControlSpace):
         of self.V_r(0)
         """
         interp_1d = []
-
-        # this code is correct but can be made more beautiful
-        # by replacing x_fct with self.id
-        x_fct = fd.SpatialCoordinate(self.mesh_r)  # used for x_int
-        # compute self.M, x_int will be overwritten below
-        x_int = fd.interpolate(x_fct[0], V.sub(0))
-        self.M = x_int.vector().size()
+        factors_1d = self.evaluate_1d_factors(V)
 
         comm = self.comm
 
-        u, v = fd.TrialFunction(V.sub(0)), fd.TestFunction(V.sub(0))
-        mass_temp = fd.assemble(u * v * fd.dx)
-        self.lg_map_fe = mass_temp.petscmat.getLGMap()[0]
-
         for dim in range(self.dim):
-
-            order = self.orders[dim]
-            knots = self.knots[dim]
             n = self.n[dim]
 
             # owned part of global problem
             local_n = n // comm.size + int(comm.rank < (n % comm.size))
-            I = PETSc.Mat().create(comm=self.comm)
-            I.setType(PETSc.Mat.Type.AIJ)
-            lsize = x_int.vector().local_size()
-            gsize = x_int.vector().size()
-            I.setSizes(((lsize, gsize), (local_n, n)))
-
-            I.setUp()
-            x_int = fd.interpolate(x_fct[dim], V.sub(0))
-            x = x_int.vector().get_local()
-            for idx in range(n):
-                coeffs = np.zeros(knots.shape, dtype=float)
-
-                # impose boundary regularity
-                coeffs[idx + self.boundary_regularities[dim]] = 1
-                degree = order - 1  # splev uses degree, not order
-                tck = (knots, coeffs, degree)
-
-                values = splev(x, tck, der=0, ext=1)
-                rows = np.where(values != 0)[0].astype(np.int32)
-                values = values[rows]
-                rows_is = PETSc.IS().createGeneral(rows)
-                global_rows_is = self.lg_map_fe.applyIS(rows_is)
-                rows = global_rows_is.array
-                I.setValues(rows, [idx], values)
-
+            (cols, vals) = factors_1d[dim]
+            lsize = cols.shape[0]
+            gsize = self.M
+
+            # each row has at most order-many nonzero entries, so the
+            # matrix can be passed to PETSc in CSR format in one go
+            mask = vals != 0
+            indptr = np.zeros(lsize + 1, dtype=PETSc.IntType)
+            np.cumsum(mask.sum(axis=1), out=indptr[1:])
+            indices = cols[mask].astype(PETSc.IntType)
+            I = PETSc.Mat().createAIJ(((lsize, gsize), (local_n, n)),
+                                      csr=(indptr, indices, vals[mask]),
+                                      comm=self.comm)
             I.assemble()  # lazy strategy for kron
             interp_1d.append(I)
 
-        # from IPython import embed; embed()
         return interp_1d
 
+    def evaluate_univariate_bsplines(self, x, dim):
+        """
+        Evaluate the univariate B-splines of dimension dim at the points x.
+
+        Returns two arrays (cols, vals) of shape (len(x), order). For every
+        point, vals contains the values of the order-many B-splines that do
+        not vanish on the knot span containing the point, and cols contains
+        their indices in the univariate spline space (i.e., after imposing
+        boundary regularity). Entries that do not correspond to a basis
+        function of the spline space (or to points outside of the bounding
+        box) have value 0.
+
+        The knot spans are located with a single searchsorted and the
+        values are computed with the Cox-de Boor recursion, see Algorithm
+        A2.2 in "The NURBS Book" by Piegl and Tiller.
+        """
+        order = self.orders[dim]
+        knots = self.knots[dim]
+        degree = order - 1
+        x = np.asarray(x, dtype=float)
+        npoints = len(x)
+
+        # knots[span] <= x < knots[span+1], the last nonempty span is closed
+        span = np.searchsorted(knots, x, side="right") - 1
+        span = np.clip(span, degree, len(knots) - order - 1)
+
+        vals = np.zeros((npoints, order))
+        vals[:, 0] = 1.
+        left = np.zeros((npoints, order))
+        right = np.zeros((npoints, order))
+        for j in range(1, order):
+            left[:, j] = x - knots[span + 1 - j]
+            right[:, j] = knots[span + j] - x
+            saved = np.zeros(npoints)
+            for r in range(j):
+                temp = vals[:, r] / (right[:, r + 1] + left[:, j - r])
+                vals[:, r] = saved + right[:, r + 1] * temp
+                saved = left[:, j - r] * temp
+            vals[:, j] = saved
+
+        # same convention as splev(..., ext=1): zero outside the bbox
+        outside = (x < knots[0]) | (x > knots[-1])
+        vals[outside, :] = 0.
+
+        # impose boundary regularity
+        cols = span[:, None] - degree + np.arange(order)[None, :] \
+            - self.boundary_regularities[dim]
+        invalid = (cols < 0) | (cols >= self.n[dim])
+        vals[invalid] = 0.
+        cols[invalid] = 0
+        return (cols, vals)
+
     def vectorkron(self, v, w):
         """
         Compute the kronecker product of two sparse vectors.
@@ -503,80 +745,88 @@ class BsplineControlSpace(ControlSpace):
 
         Do this by computing the kron product of the rows of
         the 1d univariate interpolation matrices.
-        In the future, this may be done matrix-free.
-        """
-        # this is one of the two bottlenecks that slow down initiating Bsplines
-        IFW = PETSc.Mat().create(self.comm)
-        IFW.setType(PETSc.Mat.Type.AIJ)
 
+        The rows of the 1d matrices are extracted in CSR format and padded
+        to the same length, so that the kron products of all local rows
+        are computed at once. The result is passed to PETSc in CSR format,
+        which gives the exact (diagonal and off-diagonal) preallocation.
+        """
         comm = self.comm
         # owned part of global problem
         local_N = self.N // comm.size + int(comm.rank < (self.N % comm.size))
         (lsize, gsize) = interp_1d[0].getSizes()[0]
-        IFW.setSizes(((lsize, gsize), (local_N, self.N)))
-
-        # guess sparsity pattern from interp_1d[0]
-        for row in range(lsize):
-            row = self.lg_map_fe.apply([row])[0]
-            nnz_ = len(interp_1d[0].getRow(row)[0])  # lenght of nnz-array
-            self.IFWnnz = max(self.IFWnnz, nnz_**self.dim)
-        IFW.setPreallocationNNZ(self.IFWnnz)
-        IFW.setUp()
-
-        for row in range(lsize):
-            row = self.lg_map_fe.apply([row])[0]
-            M = [[A.getRow(row)[0],
-                  A.getRow(row)[1], A.getSize()[1]] for A in interp_1d]
-            M = reduce(self.vectorkron, M)
-            columns, values, lenght = M
-            IFW.setValues([row], columns, values)
 
+        # column index and value of the kron product of the padded rows
+        cols = np.zeros((lsize, 1), dtype=PETSc.IntType)
+        vals = np.ones((lsize, 1))
+        for A in interp_1d:
+            (A_cols, A_vals) = self.padded_rows(A)
+            n = A.getSize()[1]
+            cols = (cols[:, :, None] * n + A_cols[:, None, :]).reshape(
+                lsize, -1)
+            vals = (vals[:, :, None] * A_vals[:, None, :]).reshape(lsize, -1)
+
+        mask = vals != 0
+        indptr = np.zeros(lsize + 1, dtype=PETSc.IntType)
+        np.cumsum(mask.sum(axis=1), out=indptr[1:])
+        self.IFWnnz = int(np.max(np.diff(indptr), initial=0))
+        IFW = PETSc.Mat().createAIJ(((lsize, gsize), (local_N, self.N)),
+                                    csr=(indptr, cols[mask], vals[mask]),
+                                    comm=comm)
         IFW.assemble()
         return IFW
 
+    def padded_rows(self, A):
+        """
+        Return the local rows of the sparse matrix A as two arrays
+        (cols, vals) of shape (number of local rows, maximal row length).
+        Shorter rows are padded with zero values.
+        """
+        (indptr, indices, data) = A.getValuesCSR()
+        lengths = np.diff(indptr)
+        width = int(np.max(lengths, initial=0))
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        position = np.arange(len(indices)) - np.repeat(indptr[:-1], lengths)
+        cols = np.zeros((len(lengths), width), dtype=PETSc.IntType)
+        vals = np.zeros((len(lengths), width))
+        cols[rows, position] = indices
+        vals[rows, position] = data
+        return (cols, vals)
+
     def construct_full_interpolation_matrix(self, IFW):
         """
         Assemble interpolation matrix for vectorial tensorized spline space.
         """
-        # this is one of the two bottlenecks that slow down initiating Bsplines
-        FullIFW = PETSc.Mat().create(self.comm)
-        FullIFW.setType(PETSc.Mat.Type.AIJ)
-
         # set proper matrix sizes
         d = self.dim
         free_dims = list(set(range(self.dim)) - set(self.fixed_dims))
         dfree = len(free_dims)
         ((lsize, gsize), (lsize_spline, gsize_spline)) = IFW.getSizes()
-        FullIFW.setSizes(((d * lsize, d * gsize),
-                          (dfree * lsize_spline, dfree * gsize_spline)))
-
-        # (over)estimate sparsity pattern using row with most nonzeros
-        # possible memory improvement: allocate precise sparsity pattern
-        # row by row (but this needs nnzdiagonal and nnzoffidagonal;
-        # not straightforward to do)
-        global_rows = self.lg_map_fe.apply([range(lsize)])
-        for ii, row in enumerate(range(lsize)):
-            row = global_rows[row]
-            self.FullIFWnnz = max(self.FullIFWnnz, len(IFW.getRow(row)[1]))
-        FullIFW.setPreallocationNNZ(self.FullIFWnnz)
-
-        # preallocate matrix
-        FullIFW.setUp()
-
-        # fill matrix by blowing up entries from IFW to do the right thing
-        # on vector fields (it's not just a block matrix: values are
-        # interleaved as this is how firedrake handles vector fields)
-        innerloop_idx = [[i, free_dims[i]] for i in range(dfree)]
-        for row in range(lsize):  # for every FE dof
-            row = self.lg_map_fe.apply([row])[0]
-            # extract value of all tensorize Bsplines at this dof
-            (cols, vals) = IFW.getRow(row)
-            expandedcols = dfree * cols
-            for j, dim in innerloop_idx:
-                FullIFW.setValues([d * row + dim],   # global row
-                                  expandedcols + j,  # global column
-                                  vals)
 
+        # blow up entries from IFW to do the right thing on vector fields
+        # (it's not just a block matrix: values are interleaved as this is
+        # how firedrake handles vector fields). Row d*row+dim contains the
+        # entries of row of IFW, with columns dfree*cols+j.
+        (indptr, indices, data) = IFW.getValuesCSR()
+        lengths = np.diff(indptr)
+        self.FullIFWnnz = int(np.max(lengths, initial=0))
+        full_lengths = np.zeros((lsize, d), dtype=PETSc.IntType)
+        full_lengths[:, free_dims] = lengths[:, None]
+        full_indptr = np.zeros(d * lsize + 1, dtype=PETSc.IntType)
+        np.cumsum(full_lengths.reshape(-1), out=full_indptr[1:])
+
+        rows = np.repeat(np.arange(lsize), lengths)
+        j = np.arange(dfree)[:, None]
+        order = np.argsort((dfree * rows[None, :] + j).reshape(-1),
+                           kind="stable")
+        full_indices = (dfree * indices[None, :] + j).reshape(-1)[order]
+        full_data = np.tile(data, dfree)[order]
+
+        FullIFW = PETSc.Mat().createAIJ(
+            ((d * lsize, d * gsize),
+             (dfree * lsize_spline, dfree * gsize_spline)),
+            csr=(full_indptr, full_indices.astype(PETSc.IntType), full_data),
+            comm=self.comm)
         FullIFW.assemble()
         return FullIFW
 
@@ -597,7 +847,7 @@ class BsplineControlSpace(ControlSpace):
 
     def visualize_control(self, q, out):
         with out.dat.vec_wo as outp:
-            self.I_control.mult(q.vec_wo(), outp)
+            self.I_control.mult(q.vec_ro(), outp)
 
     def store(self, vec, filename="control.dat"):
         """
@@ -619,6 +869,210 @@ class BsplineControlSpace(ControlSpace):
         vec.vec_wo().load(viewer)
 
 
+class BlockInterpolation(object):
+    """
+    Python context of a PETSc shell matrix that applies the scalar
+    interpolation matrix IFW of a BsplineControlSpace to every free
+    component of a vector field.
+
+    Firedrake interleaves the components of vector fields, so the
+    component dim of FE dof i is entry d*i+dim, and the component j of
+    B-spline i is entry dfree*i+j. Fixed dimensions are set to zero.
+    Without fixed dimensions, BsplineControlSpace uses a BAIJ matrix
+    instead (see build_block_interpolation_matrix).
+    """
+
+    def __init__(self, IFW, dim, fixed_dims):
+        self.IFW = IFW
+        self.d = dim
+        self.free_dims = sorted(set(range(dim)) - set(fixed_dims))
+        self.dfree = len(self.free_dims)
+        # work vectors for a single component
+        (self.x, self.y) = IFW.createVecs()
+
+    def mult(self, mat, x, y):
+        x_arr = x.array_r.reshape(-1, self.dfree)
+        y_arr = y.array.reshape(-1, self.d)
+        y_arr[:] = 0.
+        for (j, dim) in enumerate(self.free_dims):
+            self.x.array = x_arr[:, j]
+            self.IFW.mult(self.x, self.y)
+            y_arr[:, dim] = self.y.array_r
+
+    def multTranspose(self, mat, x, y):
+        x_arr = x.array_r.reshape(-1, self.d)
+        y_arr = y.array.reshape(-1, self.dfree)
+        for (j, dim) in enumerate(self.free_dims):
+            self.y.array = x_arr[:, dim]
+            self.IFW.multTranspose(self.y, self.x)
+            y_arr[:, j] = self.x.array_r
+
+
+class SumFactorizedInterpolation(object):
+    """
+    Python context of a PETSc shell matrix that applies the interpolation
+    matrix of a BsplineControlSpace without assembling it.
+
+    Every row of the interpolation matrix is the Kronecker product of the
+    corresponding rows of the univariate interpolation matrices, and every
+    row of these has at most order-many nonzero entries. Hence, it suffices
+    to store these entries (see BsplineControlSpace.evaluate_1d_factors)
+    and to form the products while computing mult and multTranspose.
+
+    The B-spline coefficients needed by this process are those in the
+    smallest box of tensor indices that contains all the supports of the
+    local rows. They are gathered in (and scattered back from) a local work
+    vector.
+    """
+
+    def __init__(self, factors_1d, n, dim, fixed_dims):
+        self.n = n
+        self.d = dim
+        self.free_dims = sorted(set(range(dim)) - set(fixed_dims))
+        self.dfree = len(self.free_dims)
+        self.lsize = factors_1d[0][0].shape[0]
+
+        # shift indices so that they refer to the local box of coefficients,
+        # entries with value 0 are set to point to the first coefficient
+        nonzero_rows = np.ones(self.lsize, dtype=bool)
+        for (cols, vals) in factors_1d:
+            nonzero_rows &= np.any(vals != 0, axis=1)
+        self.factors = []
+        self.box = []
+        for (cols, vals) in factors_1d:
+            active = (vals != 0) & nonzero_rows[:, None]
+            if np.any(active):
+                lo = cols[active].min()
+                hi = cols[active].max()
+            else:
+                (lo, hi) = (0, -1)
+            self.box.append((lo, hi))
+            self.factors.append((np.where(active, cols - lo, 0),
+                                 np.where(active, vals, 0.)))
+        self.box_shape = tuple(hi - lo + 1 for (lo, hi) in self.box)
+
+        # process rows in chunks to limit the size of temporary arrays
+        entries = self.dfree * reduce(lambda x, y: x * y,
+                                      [c.shape[1] for (c, v) in factors_1d])
+        self.chunk = max(1, 2**20 // max(1, entries))
+        self.scatter = None
+
+    def create_scatter(self, x):
+        """Create the scatter from x (in the column space) to the box."""
+        ranges = [np.arange(lo, hi + 1) for (lo, hi) in self.box]
+        flat = np.ravel_multi_index(np.meshgrid(*ranges, indexing="ij"),
+                                    self.n)
+        indices = flat.reshape(-1, 1) * self.dfree + np.arange(self.dfree)
+        indices = indices.reshape(-1).astype(PETSc.IntType)
+
+        self.x_box = PETSc.Vec().createSeq(len(indices),
+                                           comm=PETSc.COMM_SELF)
+        is_box = PETSc.IS().createGeneral(indices, comm=PETSc.COMM_SELF)
+        self.scatter = PETSc.Scatter().create(x, is_box, self.x_box, None)
+
+    def chunks(self):
+        for start in range(0, self.lsize, self.chunk):
+            rows = slice(start, min(start + self.chunk, self.lsize))
+            # broadcast the 1D factors against each other
+            idx = []
+            weights = 1.
+            for (i, (cols, vals)) in enumerate(self.factors):
+                shape = [cols[rows].shape[0]] + [1] * self.d
+                shape[i + 1] = cols.shape[1]
+                idx.append(cols[rows].reshape(shape))
+                weights = weights * vals[rows].reshape(shape)
+            yield (rows, tuple(idx), weights)
+
+    def mult(self, mat, x, y):
+        if self.scatter is None:
+            self.create_scatter(x)
+        self.scatter.scatter(x, self.x_box, addv=PETSc.InsertMode.INSERT,
+                             mode=PETSc.ScatterMode.FORWARD)
+        x_box = self.x_box.array_r.reshape(self.box_shape + (self.dfree,))
+        y_arr = y.array.reshape(-1, self.d)
+        y_arr[:] = 0.
+        if x_box.size == 0:
+            return
+        for (rows, idx, weights) in self.chunks():
+            vals = x_box[idx] * weights[..., None]
+            vals = vals.reshape(vals.shape[0], -1, self.dfree).sum(axis=1)
+            y_arr[rows, self.free_dims] = vals
+
+    def multTranspose(self, mat, x, y):
+        if self.scatter is None:
+            self.create_scatter(y)
+        x_arr = x.array_r.reshape(-1, self.d)[:, self.free_dims]
+        size = self.x_box.getSize() // max(1, self.dfree)
+        x_box = np.zeros((size, self.dfree))
+        if x_box.size > 0:
+            for (rows, idx, weights) in self.chunks():
+                flat = np.ravel_multi_index(idx, self.box_shape)
+                flat = np.broadcast_to(flat, weights.shape).reshape(-1)
+                for j in range(self.dfree):
+                    vals = weights * x_arr[rows, j].reshape(
+                        (-1,) + (1,) * self.d)
+                    x_box[:, j] += np.bincount(flat, weights=vals.reshape(-1),
+                                               minlength=size)
+        self.x_box.array = x_box.reshape(-1)
+        y.zeroEntries()
+        self.scatter.scatter(self.x_box, y, addv=PETSc.InsertMode.ADD,
+                             mode=PETSc.ScatterMode.REVERSE)
+
+
+class VectorPool(object):
+    """
+    Pool of the data (fd.Function or PETSc.Vec) of ControlVectors.
+
+    ROL clones vectors all the time. Instead of allocating new data for
+    every clone, data is taken from the pool and returned to it when the
+    ControlVector is garbage collected (see ControlVector.clone).
+
+    Statistics:
+        hits: number of requests served from the pool
+        misses: number of requests that allocated new data
+        live: number of data objects currently in use
+        peak: maximal number of data objects in use at the same time
+    """
+
+    def __init__(self, create):
+        """
+        Input:
+        create: function without arguments that allocates new zero data
+        """
+        self.create = create
+        self.free = []
+        self.hits = 0
+        self.misses = 0
+        self.live = 0
+        self.peak = 0
+
+    def acquire(self):
+        """Return zero data, taken from the pool if possible."""
+        if len(self.free) > 0:
+            data = self.free.pop()
+            if isinstance(data, fd.Function):
+                with data.dat.vec_wo as vec:
+                    vec.set(0.)
+            else:
+                data.set(0.)
+            self.hits += 1
+        else:
+            data = self.create()
+            self.misses += 1
+        self.live += 1
+        self.peak = max(self.peak, self.live)
+        return data
+
+    def release(self, data):
+        """Return data to the pool."""
+        self.live -= 1
+        self.free.append(data)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "live": self.live, "peak": self.peak}
+
+
 class ControlVector(ROL.Vector):
     """
     A ControlVector is a variable in the ControlSpace.
@@ -629,8 +1083,23 @@ class ControlVector(ROL.Vector):
 
     A ControlVector is a ROL.Vector and thus needs the following methods:
     plus, scale, clone, dot, axpy, set.
+
+    Every ControlVector carries a state id that changes whenever its data is
+    modified (by plus, scale, axpy, vec_wo, ...). Two ControlVectors with
+    the same state id have the same content: state ids are unique, except
+    that set copies the state id along with the data. Code that modifies
+    the data by other means (e.g. through self.fun) must call
+    mark_modified.
+
+    The dual representation A*v of a ControlVector v (where A is the matrix
+    of the inner product, see InnerProduct.apply) is cached, so that dot
+    and norm of unchanged vectors are plain vector dot products. The cache
+    is invalid as soon as the state id changes, but plus, scale, axpy and
+    set update it linearly when possible.
     """
 
+    state_ids = itertools.count()
+
     def __init__(self, controlspace: ControlSpace, inner_product: InnerProduct,
                  data=None, boundary_extension=None):
         super().__init__()
@@ -646,6 +1115,13 @@ class ControlVector(ROL.Vector):
             self.fun = data
         else:
             self.fun = None
+        self.dual_data = None
+        self.dual_id = None
+        self.mark_modified()
+
+    def mark_modified(self):
+        """Give self a new state id. Call after modifying self.data."""
+        self.state_id = next(ControlVector.state_ids)
 
     def from_first_derivative(self, fe_deriv):
         if self.boundary_extension is not None:
@@ -660,6 +1136,7 @@ class ControlVector(ROL.Vector):
             self.controlspace.restrict(residual_smoothed, self)
         else:
             self.controlspace.restrict(fe_deriv, self)
+        self.mark_modified()
 
     def to_coordinatefield(self, out):
         self.controlspace.interpolate(self, out)
@@ -672,6 +1149,18 @@ class ControlVector(ROL.Vector):
         Overwrites the content.
         """
         self.inner_product.riesz_map(self, self)
+        self.mark_modified()
+
+    def set_tolerance(self, tol):
+        """
+        Adapt the accuracy of the Riesz map and of the boundary extension
+        to the accuracy tol requested by ROL, or make them exact again if
+        tol is None. The inner product and the boundary extension are
+        shared with other ControlVectors.
+        """
+        self.inner_product.set_tolerance(tol)
+        if self.boundary_extension is not None:
+            self.boundary_extension.set_tolerance(tol)
 
     def vec_ro(self):
         if isinstance(self.data, fd.Function):
@@ -681,45 +1170,132 @@ class ControlVector(ROL.Vector):
             return self.data
 
     def vec_wo(self):
+        self.mark_modified()
         if isinstance(self.data, fd.Function):
             with self.data.dat.vec_wo as v:
                 return v
         else:
             return self.data
 
+    def dual_vec(self):
+        """Return the PETSc.Vec that stores the cached A*self."""
+        if self.dual_data is None:
+            pool = self.controlspace.get_vector_pool()
+            self.dual_data = pool.acquire()
+            weakref.finalize(self, pool.release, self.dual_data)
+        if isinstance(self.dual_data, fd.Function):
+            with self.dual_data.dat.vec as v:
+                return v
+        else:
+            return self.dual_data
+
+    def cached_dual(self):
+        """Return A*self if it is cached, otherwise None."""
+        if self.dual_id != self.state_id:
+            return None
+        return self.dual_vec()
+
+    def get_dual(self):
+        """
+        Return A*self, where A is the matrix of the inner product, or None
+        if the inner product does not implement InnerProduct.apply.
+        """
+        dual = self.cached_dual()
+        if dual is None:
+            dual = self.dual_vec()
+            try:
+                self.inner_product.apply(self, dual)
+            except NotImplementedError:
+                return None
+            self.dual_id = self.state_id
+        return dual
+
     def plus(self, v):
+        dual = self.cached_dual()
+        v_dual = v.cached_dual()
         vec = self.vec_wo()
         vec += v.vec_ro()
+        if dual is not None and v_dual is not None:
+            dual.axpy(1., v_dual)
+            self.dual_id = self.state_id
 
     def scale(self, alpha):
+        dual = self.cached_dual()
         vec = self.vec_wo()
         vec *= alpha
+        if dual is not None:
+            dual.scale(alpha)
+            self.dual_id = self.state_id
 
     def clone(self):
         """
         Returns a zero vector of the same size of self.
 
         The name of this method is misleading, but it is dictated by ROL.
+
+        The data of the clone comes from the VectorPool of the ControlSpace
+        and is returned to it once the clone is garbage collected. Hence,
+        one must not keep references to res.data or res.fun beyond the
+        lifetime of res.
         """
+        pool = self.controlspace.get_vector_pool()
+        data = pool.acquire()
         res = ControlVector(self.controlspace, self.inner_product,
+                            data=data,
                             boundary_extension=self.boundary_extension)
+        weakref.finalize(res, pool.release, data)
         # res.set(self)
         return res
 
     def dot(self, v):
         """Inner product between self and v."""
+        v_dual = v.cached_dual()
+        if v_dual is not None:
+            return self.vec_ro().dot(v_dual)
+        dual = self.get_dual()
+        if dual is not None:
+            return v.vec_ro().dot(dual)
         return self.inner_product.eval(self, v)
 
     def norm(self):
-        return self.dot(self)**0.5
+        dual = self.get_dual()
+        if dual is not None:
+            return self.vec_ro().dot(dual)**0.5
+        return self.inner_product.eval_norm(self)
 
     def axpy(self, alpha, x):
+        if x is self:
+            # PETSc does not allow aliased arguments in axpy
+            self.scale(1. + alpha)
+            return
+        dual = self.cached_dual()
+        x_dual = x.cached_dual()
         vec = self.vec_wo()
         vec.axpy(alpha, x.vec_ro())
+        if dual is not None and x_dual is not None:
+            dual.axpy(alpha, x_dual)
+            self.dual_id = self.state_id
+
+    def maxpy(self, alphas, xs):
+        """Add alphas[i] * xs[i] for all i to self."""
+        dual = self.cached_dual()
+        x_duals = [x.cached_dual() for x in xs]
+        vec = self.vec_wo()
+        vec.maxpy(alphas, [x.vec_ro() for x in xs])
+        if dual is not None and all(d is not None for d in x_duals):
+            dual.maxpy(alphas, x_duals)
+            self.dual_id = self.state_id
 
     def set(self, v):
+        if v is self:
+            return
+        v_dual = v.cached_dual()
         vec = self.vec_wo()
         v.vec_ro().copy(vec)
+        self.state_id = v.state_id
+        if v_dual is not None:
+            v_dual.copy(self.dual_vec())
+            self.dual_id = self.state_id
 
     def __str__(self):
         """String representative, so we can call print(vec)."""
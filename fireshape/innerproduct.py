@@ -1,6 +1,7 @@
 import firedrake as fd
 import numpy as np
 from firedrake.petsc import PETSc
+from .tolerance import inexact_rtol
 
 
 class InnerProduct(object):
@@ -13,6 +14,29 @@ class InnerProduct(object):
         """Evaluate inner product in primal space."""
         raise NotImplementedError
 
+    def eval_norm(self, u):
+        """Evaluate the norm of u in primal space."""
+        return self.eval(u, u)**0.5
+
+    def apply(self, u, out):
+        """
+        Compute A*u, where A is the matrix of the inner product, so that
+        eval(u, v) = v.dot(A*u).
+
+        Input:
+        u: ControlVector, in the primal space
+        out: PETSc.Vec, overwritten with A*u
+        """
+        raise NotImplementedError
+
+    def set_tolerance(self, tol):
+        """
+        Set the accuracy of the Riesz map to the accuracy tol requested by
+        ROL, or back to an exact solve if tol is None. By default, the
+        Riesz map is always solved exactly.
+        """
+        pass
+
     def riesz_map(self, v, out):  # dual to primal
         """
         Compute Riesz representative of v and save it in out.
@@ -23,6 +47,13 @@ class InnerProduct(object):
         """
         raise NotImplementedError
 
+    def riesz_map_multi(self, vs, outs):
+        """
+        Compute the Riesz representatives of all vs and save them in outs.
+        """
+        for (v, out) in zip(vs, outs):
+            self.riesz_map(v, out)
+
 
 class UflInnerProduct(InnerProduct):
 
@@ -31,16 +62,46 @@ class UflInnerProduct(InnerProduct):
     firedrake.FunctionSpace.  If the ControlSpace is not itselt the
     firedrake.FunctionSpace, then an interpolation matrix between the two is
     necessary.
+
+    If multigrid=True, the Riesz map is solved with CG preconditioned by
+    geometric multigrid on the mesh hierarchy of the ControlSpace (see
+    ControlSpace.get_prolongations_for_inner). The coarse operators are
+    Galerkin projections of the finest one, so that neither rediscretization
+    nor a factorization on the finest level is needed. This requires at
+    least one coarser level, e.g. a FeMultiGridControlSpace with
+    control_level > 0.
+
+    If inexact=True, the tolerance of the iterative Riesz map solver is
+    adapted to the accuracy requested by ROL (see set_tolerance).
+
+    If mat_type="matfree", the weak form is not assembled. eval applies its
+    action on the fly and the Riesz map is solved with a Krylov method. For
+    elements of degree > 1, it is preconditioned by a two-level method whose
+    coarse level is the weak form rediscretized with P1 elements (see
+    firedrake.P1PC), so that only the P1 operator is assembled. For P1
+    elements, the preconditioner assembles the operator itself (see
+    firedrake.AssembledPC). Matrix-free inner products are not available
+    for interpolated ControlSpaces such as the BsplineControlSpace, because
+    transpose(I)*A*I requires the assembled operator A.
     """
 
-    def __init__(self, Q, fixed_bids=[], extra_bcs=[], direct_solve=False):
+    def __init__(self, Q, fixed_bids=[], extra_bcs=[], direct_solve=False,
+                 cache=None, multigrid=False, mat_type="aij",
+                 inexact=False):
         if isinstance(extra_bcs, fd.DirichletBC):
             extra_bcs = [extra_bcs]
+        if mat_type not in ["aij", "matfree"]:
+            raise ValueError("mat_type must be 'aij' or 'matfree'.")
 
         self.direct_solve = direct_solve
+        self.multigrid = multigrid
+        self.mat_type = mat_type
+        self.inexact = inexact
+        # extra_bcs cannot be hashed, so operators are not cached with them
+        self.cache = cache if len(extra_bcs) == 0 else None
         self.fixed_bids = fixed_bids  # fixed parts of bdry
-        self.params = self.get_params()  # solver parameters
         self.Q = Q
+        self.params = self.get_params()  # solver parameters
 
         """
         V: type fd.FunctionSpace
@@ -52,6 +113,28 @@ class UflInnerProduct(InnerProduct):
         for bid in self.fixed_bids:
             self.free_bids.remove(bid)
 
+        if self.multigrid:
+            if I_interp is not None:
+                raise NotImplementedError("Multigrid is not available for "
+                                          "interpolated ControlSpaces.")
+            if self.mat_type == "matfree":
+                raise NotImplementedError("Multigrid requires an assembled "
+                                          "inner product.")
+            prolongations = Q.get_prolongations_for_inner()
+            if len(prolongations) == 0:
+                raise ValueError("Multigrid requires a coarser level than "
+                                 "the one of the ControlSpace, e.g. "
+                                 "control_level > 0.")
+        if self.mat_type == "matfree" and I_interp is not None:
+            raise NotImplementedError("Matrix-free inner products are not "
+                                      "available for interpolated "
+                                      "ControlSpaces.")
+
+        if self.cache is not None:
+            self.cache_key = self.cache.key(
+                V.mesh(), type(self).__name__, str(V.ufl_element()),
+                self.fixed_bids, getattr(Q, "cache_key", None))
+
         # Some weak forms have a nullspace. We import the nullspace if no
         # parts of the bdry are fixed (we assume that a DirichletBC is
         # sufficient to empty the nullspace).
@@ -79,34 +162,48 @@ class UflInnerProduct(InnerProduct):
 
         if len(bcs) == 0:
             bcs = None
-
-        a = self.get_weak_form(V)
-        A = fd.assemble(a, mat_type='aij', bcs=bcs)
-        ls = fd.LinearSolver(A, solver_parameters=self.params,
-                             nullspace=nsp, transpose_nullspace=nsp)
-        self.ls = ls
-        self.A = A.petscmat
+        self.bcs = bcs
+
+        # transpose(I)*A*I may have been cached, then A is not needed
+        ITAI = None
+        if I_interp is not None and self.cache is not None:
+            sizes = (I_interp.getSizes()[1], I_interp.getSizes()[1])
+            ITAI = self.cache.load_mat(self.cache_key, "ITAI", sizes, V.comm)
+
+        if ITAI is None:
+            a = self.get_weak_form(V)
+            A = fd.assemble(a, mat_type=self.mat_type, bcs=bcs)
+            ls = fd.LinearSolver(A, solver_parameters=self.params,
+                                 nullspace=nsp, transpose_nullspace=nsp)
+            self.ls = ls
+            self.A = A.petscmat
         self.interpolated = False
+        # work function for the right-hand sides of the Riesz map
+        self.rhs = fd.Function(V)
+
+        if self.multigrid:
+            self.Aksp = self.get_multigrid_solver(prolongations, nsp)
 
         # If the matrix I is passed, replace A with transpose(I)*A*I
         # and set up a ksp solver for self.riesz_map
         if I_interp is not None:
             self.interpolated = True
-            ITAI = self.A.PtAP(I_interp)
-            from firedrake.petsc import PETSc
-            import numpy as np
-            zero_rows = []
-
-            # if there are zero-rows, replace them with rows that
-            # have 1 on the diagonal entry
-            for row in range(*ITAI.getOwnershipRange()):
-                (cols, vals) = ITAI.getRow(row)
-                valnorm = np.linalg.norm(vals)
-                if valnorm < 1e-13:
-                    zero_rows.append(row)
-            for row in zero_rows:
-                ITAI.setValue(row, row, 1.0)
-            ITAI.assemble()
+            if ITAI is None:
+                ITAI = self.A.PtAP(I_interp)
+
+                # if there are zero-rows, replace them with rows that
+                # have 1 on the diagonal entry
+                (indptr, indices, vals) = ITAI.getValuesCSR()
+                rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+                valnorms = np.sqrt(np.bincount(rows, weights=abs(vals)**2,
+                                               minlength=len(indptr) - 1))
+                zero_rows = np.where(valnorms < 1e-13)[0]
+                zero_rows += ITAI.getOwnershipRange()[0]
+                for row in zero_rows:
+                    ITAI.setValue(row, row, 1.0)
+                ITAI.assemble()
+                if self.cache is not None:
+                    self.cache.store_mat(self.cache_key, "ITAI", ITAI)
 
             # overwrite the self.A created by get_impl
             self.A = ITAI
@@ -121,6 +218,9 @@ class UflInnerProduct(InnerProduct):
             Aksp.setUp()
             self.Aksp = Aksp
 
+        # work vectors, so that eval and riesz_map do not allocate
+        (self.rhs_vec, self.A_u) = self.A.createVecs()
+
     def get_params(self):
         """PETSc parameters to solve linear system."""
         params = {
@@ -129,14 +229,92 @@ class UflInnerProduct(InnerProduct):
             'ksp_stol': 1e-16,
             'ksp_type': 'bcgs',
         }
-        if self.direct_solve:
-            params["pc_type"] = "cholesky"
-            params["pc_factor_mat_solver_type"] = "mumps"
+        if self.multigrid:
+            params.update({
+                'ksp_type': 'cg',
+                'pc_type': 'mg',
+                'pc_mg_galerkin': 'both',
+                'mg_levels_ksp_type': 'chebyshev',
+                'mg_levels_ksp_max_it': 2,
+                'mg_levels_pc_type': 'sor',
+                'mg_coarse_ksp_type': 'preonly',
+                'mg_coarse_pc_type': 'lu',
+                'mg_coarse_pc_factor_mat_solver_type': 'mumps',
+                # the inner product may have a nullspace
+                'mg_coarse_mat_mumps_icntl_24': 1,
+            })
         else:
-            params["pc_type"] = "hypre"
-            params["pc_hypre_type"] = "boomeramg"
+            if self.direct_solve:
+                pc_params = {"pc_type": "cholesky",
+                             "pc_factor_mat_solver_type": "mumps"}
+            else:
+                pc_params = {"pc_type": "hypre",
+                             "pc_hypre_type": "boomeramg"}
+            if self.mat_type == "matfree":
+                params["pc_type"] = "python"
+                V = self.Q.get_space_for_inner()[0]
+                if V.ufl_element().degree() == 1:
+                    # precondition with the assembled operator
+                    params["pc_python_type"] = "firedrake.AssembledPC"
+                    prefix = "assembled_"
+                else:
+                    # smooth with the matrix-free operator and solve with
+                    # its P1 rediscretization on the coarse level
+                    params.update({
+                        'pc_python_type': 'firedrake.P1PC',
+                        'pmg_mg_levels_ksp_type': 'chebyshev',
+                        'pmg_mg_levels_ksp_max_it': 2,
+                        'pmg_mg_levels_pc_type': 'jacobi',
+                        'pmg_mg_coarse_mat_type': 'aij',
+                        'pmg_mg_coarse_ksp_type': 'preonly',
+                    })
+                    prefix = "pmg_mg_coarse_"
+                pc_params = {prefix + key: val
+                             for (key, val) in pc_params.items()}
+            params.update(pc_params)
         return params
 
+    def set_tolerance(self, tol):
+        """
+        Set the relative tolerance of the Riesz map solver to match the
+        accuracy tol requested by ROL (only if inexact=True). If tol is
+        None, the tolerance of self.params is restored.
+        """
+        if not self.inexact:
+            return
+        if self.interpolated or self.multigrid:
+            ksp = self.Aksp
+        else:
+            ksp = self.ls.ksp
+        if tol is None:
+            ksp.setTolerances(rtol=self.params["ksp_rtol"])
+        else:
+            ksp.setTolerances(rtol=inexact_rtol(tol))
+
+    def get_multigrid_solver(self, prolongations, nsp):
+        """
+        Create a PETSc.KSP for self.A with a geometric multigrid
+        preconditioner whose levels are connected by prolongations.
+        """
+        comm = self.A.getComm()
+        if nsp is not None:
+            nullspace = nsp.nullspace(comm=comm)
+            self.A.setNullSpace(nullspace)
+            self.A.setTransposeNullSpace(nullspace)
+        ksp = PETSc.KSP().create(comm=comm)
+        ksp.setOperators(self.A)
+        ksp.setOptionsPrefix("riesz_mg_")
+        opts = PETSc.Options("riesz_mg_")
+        for (key, val) in self.params.items():
+            opts[key] = val
+        ksp.pc.setType("mg")
+        ksp.pc.setMGLevels(len(prolongations) + 1)
+        for (level, P) in enumerate(prolongations):
+            ksp.pc.setMGInterpolation(level + 1, P)
+        ksp.setFromOptions()
+        ksp.setUp()
+        return ksp
+
     def get_weak_form(self, V):
         """ Weak formulation of inner product (in UFL)."""
         raise NotImplementedError
@@ -147,11 +325,17 @@ class UflInnerProduct(InnerProduct):
 
     def eval(self, u, v):
         """Evaluate inner product in primal space."""
-        A_u = self.A.createVecLeft()
+        self.A.mult(u.vec_ro(), self.A_u)
+        return v.vec_ro().dot(self.A_u)
+
+    def eval_norm(self, u):
+        """Evaluate the norm of u in primal space."""
         uvec = u.vec_ro()
-        vvec = v.vec_ro()
-        self.A.mult(uvec, A_u)
-        return vvec.dot(A_u)
+        self.A.mult(uvec, self.A_u)
+        return uvec.dot(self.A_u)**0.5
+
+    def apply(self, u, out):
+        self.A.mult(u.vec_ro(), out)
 
     def riesz_map(self, v, out):  # dual to primal
         """
@@ -162,9 +346,76 @@ class UflInnerProduct(InnerProduct):
         out: ControlVector, in the primal space
         """
         if self.interpolated:
-            self.Aksp.solve(v.vec_ro(), out.vec_wo())
-        else:
+            # v and out may be the same vector
+            v.vec_ro().copy(self.rhs_vec)
+            self.Aksp.solve(self.rhs_vec, out.vec_wo())
+        elif self.mat_type == "matfree":
+            # the preconditioner of the matrix-free operator needs the
+            # context that fd.LinearSolver.solve attaches to the KSP
             self.ls.solve(out.fun, v.fun)
+            out.mark_modified()
+        else:
+            # solve with the KSP directly, fd.LinearSolver.solve would
+            # allocate a new right-hand side for the boundary conditions
+            self.rhs.assign(v.fun)
+            if self.bcs is not None:
+                for bc in self.bcs:
+                    bc.apply(self.rhs)
+            with self.rhs.dat.vec_ro as rhs:
+                if self.multigrid:
+                    self.Aksp.solve(rhs, out.vec_wo())
+                else:
+                    with self.ls.inserted_options():
+                        self.ls.ksp.solve(rhs, out.vec_wo())
+
+    def riesz_map_multi(self, vs, outs):
+        """
+        Compute the Riesz representatives of all vs and save them in outs.
+
+        The right-hand sides are collected in a dense matrix and solved
+        for with one KSPMatSolve. For direct solvers, this is a single
+        MatMatSolve with the factorization.
+        """
+        if self.interpolated or self.multigrid:
+            ksp = self.Aksp
+        else:
+            ksp = self.ls.ksp
+        if len(vs) < 2 or not hasattr(ksp, "matSolve"):
+            return super().riesz_map_multi(vs, outs)
+        (B, X) = self.get_dense_work_mats(len(vs))
+        B_array = B.getDenseArray()
+        for (j, v) in enumerate(vs):
+            if self.interpolated:
+                B_array[:, j] = v.vec_ro().getArray(readonly=True)
+                continue
+            self.rhs.assign(v.fun)
+            if self.bcs is not None:
+                for bc in self.bcs:
+                    bc.apply(self.rhs)
+            with self.rhs.dat.vec_ro as rhs:
+                B_array[:, j] = rhs.getArray(readonly=True)
+        B.assemble()
+        ksp.matSolve(B, X)
+        X_array = X.getDenseArray()
+        for (j, out) in enumerate(outs):
+            out.vec_wo().setArray(X_array[:, j])
+
+    def get_dense_work_mats(self, k):
+        """
+        Return two dense matrices with k columns and the row layout of
+        self.A, which are reused as long as k does not change.
+        """
+        mats = getattr(self, "dense_work_mats", None)
+        if mats is None or mats[0].getSize()[1] != k:
+            sizes = (self.A.getSizes()[0], (PETSc.DECIDE, k))
+            comm = self.A.getComm()
+            mats = tuple(PETSc.Mat().createDense(sizes, comm=comm)
+                         for _ in range(2))
+            for mat in mats:
+                mat.setUp()
+                mat.assemble()
+            self.dense_work_mats = mats
+        return mats
 
 
 class H1InnerProduct(UflInnerProduct):
@@ -211,6 +462,10 @@ class ElasticityInnerProduct(UflInnerProduct):
 
     def get_mu(self, V):
         W = fd.FunctionSpace(V.mesh(), "CG", 1)
+        mu = fd.Function(W)
+        if self.cache is not None and \
+                self.cache.load_function(self.cache_key, "mu", mu):
+            return mu
         bcs = []
         if len(self.fixed_bids):
             bcs.append(fd.DirichletBC(W, 1, self.fixed_bids))
@@ -222,8 +477,9 @@ class ElasticityInnerProduct(UflInnerProduct):
         v = fd.TestFunction(W)
         a = fd.inner(fd.grad(u), fd.grad(v)) * fd.dx
         b = fd.inner(fd.Constant(0.), v) * fd.dx
-        mu = fd.Function(W)
         fd.solve(a == b, mu, bcs=bcs)
+        if self.cache is not None:
+            self.cache.store_function(self.cache_key, "mu", mu)
         return mu
 
     def get_weak_form(self, V):
@@ -267,6 +523,20 @@ class ElasticityInnerProduct(UflInnerProduct):
 
 class SurfaceInnerProduct(InnerProduct):
 
+    """
+    Inner product on the free parts free_bids of the boundary, given by
+    the surface H1 inner product of the tangential gradients.
+
+    The operator only acts on the boundary dofs, and eval, apply and
+    riesz_map only work with vectors of the free boundary dofs. However,
+    firedrake cannot assemble a form on the boundary dofs alone. Hence,
+    the surface form is assembled into a matrix of the size of the whole
+    space, and the block of the free boundary dofs is extracted from it.
+    Because the form contains only exterior facet integrals, the rows of
+    interior nodes of this matrix are empty. It exists only during
+    __init__, but its construction still costs a matrix of the full size.
+    """
+
     def __init__(self, Q, free_bids=["on_boundary"]):
         (V, I_interp) = Q.get_space_for_inner()
 
@@ -279,9 +549,8 @@ class SurfaceInnerProduct(InnerProduct):
 
         def surf_grad(u):
             return fd.sym(fd.grad(u) - fd.outer(fd.grad(u) * n, n))
+        # a matrix of the size of V, see the class docstring
         a = (fd.inner(surf_grad(u), surf_grad(v)) + fd.inner(u, v)) * fd.ds
-        # petsc doesn't like matrices with zero rows
-        a += 1e-10 * fd.inner(u, v) * fd.dx
         A = fd.assemble(a, mat_type="aij")
         A = A.petscmat
         tdim = V.mesh().topological_dimension()
@@ -309,6 +578,14 @@ class SurfaceInnerProduct(InnerProduct):
         # A.view()
         A.assemble()
         self.A = A
+
+        # work vectors and a scatter between the free dofs and all dofs,
+        # so that eval and riesz_map do not allocate
+        (self.usub, self.A_u) = A.createVecs()
+        self.vsub = self.usub.duplicate()
+        with fd.Function(V).dat.vec_ro as vec:
+            self.scatter = PETSc.Scatter().create(
+                vec, self.global_free_is_col, self.usub, None)
         Aksp = PETSc.KSP().create()
         Aksp.setOperators(self.A)
         Aksp.setOptionsPrefix("A_")
@@ -321,18 +598,32 @@ class SurfaceInnerProduct(InnerProduct):
         Aksp.setFromOptions()
         self.Aksp = Aksp
 
+    def restrict_to_free(self, u, usub):
+        self.scatter.scatter(u.vec_ro(), usub, addv=PETSc.InsertMode.INSERT,
+                             mode=PETSc.ScatterMode.FORWARD)
+
     def eval(self, u, v):
-        usub = u.vec_ro().getSubVector(self.global_free_is_col)
-        vsub = v.vec_ro().getSubVector(self.global_free_is_col)
-        A_u = self.A.createVecLeft()
-        self.A.mult(usub, A_u)
-        return vsub.dot(A_u)
+        self.restrict_to_free(u, self.usub)
+        self.restrict_to_free(v, self.vsub)
+        self.A.mult(self.usub, self.A_u)
+        return self.vsub.dot(self.A_u)
+
+    def eval_norm(self, u):
+        self.restrict_to_free(u, self.usub)
+        self.A.mult(self.usub, self.A_u)
+        return self.usub.dot(self.A_u)**0.5
+
+    def apply(self, u, out):
+        self.restrict_to_free(u, self.usub)
+        self.A.mult(self.usub, self.A_u)
+        out.set(0.)
+        self.scatter.scatter(self.A_u, out, addv=PETSc.InsertMode.INSERT,
+                             mode=PETSc.ScatterMode.REVERSE)
 
     def riesz_map(self, v, out):  # dual to primal
-        vsub = v.vec_ro().getSubVector(self.global_free_is_col)
-        res = self.A.createVecLeft()
-        self.Aksp.solve(vsub, res)
+        self.restrict_to_free(v, self.vsub)
+        self.Aksp.solve(self.vsub, self.usub)
         outvec = out.vec_wo()
-        outvec *= 0.
-        outvec.setValues(self.global_free_is_col.array, res.array)
-        outvec.assemble()
+        outvec.set(0.)
+        self.scatter.scatter(self.usub, outvec, addv=PETSc.InsertMode.INSERT,
+                             mode=PETSc.ScatterMode.REVERSE)
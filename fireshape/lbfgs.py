@@ -0,0 +1,231 @@
+import numpy as np
+from firedrake.petsc import PETSc
+from mpi4py import MPI
+from .control import ControlVector
+
+__all__ = ["LBFGSSolver"]
+
+
+class LBFGSSolver(object):
+    """
+    L-BFGS method with backtracking line search that works directly with
+    ControlVectors, without going through ROL.
+
+    The method is formulated in the Hilbert space defined by the inner
+    product of the ControlVectors. Following the vector-free L-BFGS of
+    Chen et al. (2014), the two-loop recursion is carried out on the
+    coefficients of the search direction with respect to the basis
+    {s_i, y_i, g}, using the Gram matrix of this basis. The Gram matrix
+    is updated once per iteration with the inner products of the new
+    vectors s, y and g with the basis. These are computed from the cached
+    dual representations of the new vectors (see ControlVector.get_dual)
+    with one MPI reduction. The search direction is then assembled with
+    one maxpy.
+
+    Usage:
+        solver = fs.LBFGSSolver(J, q, params_dict)
+        solver.solve()
+
+    params_dict is a dictionary with the structure used for ROL, of which
+    the following entries are used (with defaults):
+        'General': {'Secant': {'Maximum Storage': 10}},
+        'Step': {'Line Search': {
+            'Initial Step Size': 1.0,
+            'Function Evaluation Limit': 20,
+            'Sufficient Decrease Tolerance': 1e-4,
+            'Line-Search Method': {'Backtracking Rate': 0.5}}},
+        'Status Test': {'Gradient Tolerance': 1e-6,
+                        'Step Tolerance': 1e-12,
+                        'Iteration Limit': 100}
+    """
+
+    def __init__(self, J, q: ControlVector, params_dict={}):
+        self.J = J
+        self.q = q
+
+        def get(keys, default):
+            d = params_dict
+            for key in keys:
+                if key not in d:
+                    return default
+                d = d[key]
+            return d
+
+        self.storage = get(["General", "Secant", "Maximum Storage"], 10)
+        ls = ["Step", "Line Search"]
+        self.initial_step = get(ls + ["Initial Step Size"], 1.0)
+        self.max_evals = get(ls + ["Function Evaluation Limit"], 20)
+        self.c1 = get(ls + ["Sufficient Decrease Tolerance"], 1e-4)
+        self.rate = get(ls + ["Line-Search Method", "Backtracking Rate"],
+                        0.5)
+        self.gtol = get(["Status Test", "Gradient Tolerance"], 1e-6)
+        self.stol = get(["Status Test", "Step Tolerance"], 1e-12)
+        self.max_iter = get(["Status Test", "Iteration Limit"], 100)
+        # default accuracy that ROL requests from objectives
+        self.tol = np.sqrt(np.finfo(float).eps)
+        self.comm = q.vec_ro().getComm().tompi4py()
+
+    def solve(self):
+        """
+        Minimize J starting from self.q, which is overwritten with the
+        result. Afterwards, self.value, self.gnorm, self.snorm, self.iter
+        and self.status describe the final iterate.
+        """
+        J = self.J
+        x = self.q
+        J.update(x, True, 0)
+        f = J.value(x, self.tol)
+        g = x.clone()
+        J.gradient(g, x, self.tol)
+        if g.get_dual() is None:
+            raise NotImplementedError("LBFGSSolver requires an inner "
+                                      "product that implements apply.")
+        gg = self.reduce([g], [g])[0, 0]
+
+        # history of steps s and gradient differences y, and the Gram
+        # matrix of s_i, y_i and g
+        S = []
+        Y = []
+        SS = np.zeros((0, 0))
+        SY = np.zeros((0, 0))
+        YY = np.zeros((0, 0))
+        Sg = np.zeros(0)
+        Yg = np.zeros(0)
+
+        self.iter = 0
+        self.snorm = np.inf
+        self.status = "Iteration Limit Exceeded"
+        self.print_header()
+        self.print_iter(f, gg**0.5, None, 0)
+        while self.iter < self.max_iter:
+            if gg**0.5 < self.gtol:
+                self.status = "Gradient Tolerance Met"
+                break
+            if self.snorm < self.stol:
+                self.status = "Step Tolerance Met"
+                break
+
+            coeffs = self.two_loop(SS, SY, YY, Sg, Yg, gg)
+            gd = coeffs.dot(np.concatenate([Sg, Yg, [gg]]))
+            if gd >= 0:
+                # not a descent direction, restart with steepest descent
+                (S, Y) = ([], [])
+                (SS, SY, YY) = (np.zeros((0, 0)),) * 3
+                (Sg, Yg) = (np.zeros(0),) * 2
+                coeffs = np.array([-1.])
+                gd = -gg
+            d = x.clone()
+            d.set(g)
+            d.scale(coeffs[-1])
+            if len(S) > 0:
+                d.maxpy(coeffs[:-1], S + Y)
+
+            # backtracking line search
+            x_old = x.clone()
+            x_old.set(x)
+            t = self.initial_step
+            nevals = 0
+            while True:
+                x.set(x_old)
+                x.axpy(t, d)
+                J.update(x, True, -1)
+                f_new = J.value(x, self.tol)
+                nevals += 1
+                if f_new <= f + self.c1 * t * gd:
+                    break
+                if nevals >= self.max_evals:
+                    x.set(x_old)
+                    J.update(x, True, -1)
+                    self.status = "Line Search Failed"
+                    self.value = f
+                    self.gnorm = gg**0.5
+                    return
+                t *= self.rate
+            f = f_new
+            self.iter += 1
+            J.update(x, True, self.iter)
+
+            g_new = x.clone()
+            J.gradient(g_new, x, self.tol)
+            g_new.get_dual()
+            s = d
+            s.scale(t)
+            y = x.clone()
+            y.set(g_new)
+            y.axpy(-1., g)
+            g = g_new
+
+            # inner products of s, y, g with the new basis in one reduction
+            m = len(S)
+            R = self.reduce([s, y, g], S + [s] + Y + [y, g])
+            (s_S, s_Y) = (R[:, :m + 1], R[:, m + 1:2 * m + 2])
+            gg = R[2, -1]
+            self.snorm = R[0, m]**0.5
+            if R[0, 2 * m + 1] > 1e-12 * R[0, m]:
+                # the pair satisfies the curvature condition
+                S.append(s)
+                Y.append(y)
+                SS = np.block([[SS, s_S[0, :m, None]], [s_S[0, None, :]]])
+                SY = np.block([[SY, s_S[1, :m, None]], [s_Y[0, None, :]]])
+                YY = np.block([[YY, s_Y[1, :m, None]], [s_Y[1, None, :]]])
+                Sg = s_S[2]
+                Yg = s_Y[2]
+                if len(S) > self.storage:
+                    (S, Y) = (S[1:], Y[1:])
+                    (SS, SY, YY) = (SS[1:, 1:], SY[1:, 1:], YY[1:, 1:])
+                    (Sg, Yg) = (Sg[1:], Yg[1:])
+            else:
+                Sg = s_S[2, :m]
+                Yg = s_Y[2, :m]
+            self.print_iter(f, gg**0.5, self.snorm, nevals)
+
+        self.value = f
+        self.gnorm = gg**0.5
+        PETSc.Sys.Print("Optimization Terminated with Status: %s"
+                        % self.status)
+
+    def two_loop(self, SS, SY, YY, Sg, Yg, gg):
+        """
+        Two-loop recursion of L-BFGS on the coefficients with respect to
+        the basis {s_0, ..., s_m-1, y_0, ..., y_m-1, g}.
+        Returns the coefficients of the search direction.
+        """
+        m = len(Sg)
+        G = np.block([[SS, SY, Sg[:, None]],
+                      [SY.T, YY, Yg[:, None]],
+                      [Sg[None, :], Yg[None, :], np.array([[gg]])]])
+        rho = 1. / np.diag(SY)
+        q = np.zeros(2 * m + 1)
+        q[-1] = 1.
+        alpha = np.zeros(m)
+        for i in reversed(range(m)):
+            alpha[i] = rho[i] * G[i].dot(q)
+            q[m + i] -= alpha[i]
+        gamma = SY[-1, -1] / YY[-1, -1] if m > 0 else 1.
+        r = gamma * q
+        for i in range(m):
+            beta = rho[i] * G[m + i].dot(r)
+            r[i] += alpha[i] - beta
+        return -r
+
+    def reduce(self, us, vs):
+        """
+        Return the matrix of inner products (u, v) for u in us and v in vs.
+        The duals of the vectors in us must be cached. All inner products
+        are computed with one MPI reduction.
+        """
+        duals = [u.cached_dual().getArray(readonly=True) for u in us]
+        arrays = [v.vec_ro().getArray(readonly=True) for v in vs]
+        R = np.array([[dual.dot(array) for array in arrays]
+                      for dual in duals])
+        self.comm.Allreduce(MPI.IN_PLACE, R, op=MPI.SUM)
+        return R
+
+    def print_header(self):
+        PETSc.Sys.Print("%6s %15s %15s %15s %6s"
+                        % ("iter", "value", "gnorm", "snorm", "#fval"))
+
+    def print_iter(self, f, gnorm, snorm, nevals):
+        snorm = "" if snorm is None else "%15.6e" % snorm
+        PETSc.Sys.Print("%6d %15.6e %15.6e %15s %6d"
+                        % (self.iter, f, gnorm, snorm, nevals))
@@ -1,11 +1,46 @@
 import ROL
 import firedrake as fd
+from collections import OrderedDict
 from .control import ControlSpace
 from .pde_constraint import PdeConstraint
 
 
+def make_assembler(form, tensor=None, params=None):
+    """
+    Return a function without arguments that assembles form (into tensor,
+    for 1-forms) with the form compiler parameters params.
+
+    If firedrake provides persistent form assemblers, the assembler is
+    built once, so that its kernels and parallel loops are reused by every
+    call. Otherwise, the function calls fd.assemble.
+    """
+    try:
+        from firedrake.assemble import get_assembler
+        assembler = get_assembler(form, form_compiler_parameters=params)
+    except (ImportError, TypeError):
+        return lambda: fd.assemble(form, tensor=tensor,
+                                   form_compiler_parameters=params)
+    if tensor is None:
+        return assembler.assemble
+    return lambda: assembler.assemble(tensor=tensor)
+
+
 class Objective(ROL.Objective):
 
+    """
+    Base class of objectives.
+
+    The forms returned by value_form and derivative_form are built once and
+    then reused, since they only change through the values of their
+    coefficients (and the coordinates of the meshes). Call mark_dirty if
+    value_form or derivative_form would return a different UFL expression,
+    or set cache_forms = False for objectives that build their forms with
+    side effects or values that are not coefficients. If cache_forms, the
+    assemblers of the forms are kept as well (see make_assembler).
+    """
+
+    cache_forms = True
+
     def __init__(self, Q: ControlSpace, cb=None, scale: float = 1.0,
                  quadrature_degree: int = None):
 
@@ -29,6 +64,47 @@ class Objective(ROL.Objective):
             self.params = {"quadrature_degree": quadrature_degree}
         else:
             self.params = None
+        self.cached_value_form = None
+        self.cached_derivative_form = None
+        self.assemblers = {}
+
+    def mark_dirty(self):
+        """Rebuild the value and derivative forms when they are next used."""
+        self.cached_value_form = None
+        self.cached_derivative_form = None
+        self.assemblers = {}
+
+    def assemble_form(self, key, form, tensor=None, params=None):
+        """
+        Assemble form (into tensor, for 1-forms). If cache_forms, the
+        assembler is stored under key and reused for later calls.
+        """
+        if not self.cache_forms:
+            return fd.assemble(form, tensor=tensor,
+                               form_compiler_parameters=params)
+        if key not in self.assemblers:
+            self.assemblers[key] = make_assembler(form, tensor, params)
+        return self.assemblers[key]()
+
+    def get_value_form(self):
+        """Return self.value_form(), built only once if cache_forms."""
+        if not self.cache_forms:
+            return self.value_form()
+        if self.cached_value_form is None:
+            self.cached_value_form = self.value_form()
+        return self.cached_value_form
+
+    def get_derivative_form(self, V):
+        """
+        Return self.derivative_form(v) for a TestFunction v on V, built
+        only once if cache_forms.
+        """
+        if not self.cache_forms:
+            return self.derivative_form(fd.TestFunction(V))
+        if self.cached_derivative_form is None:
+            self.cached_derivative_form = \
+                self.derivative_form(fd.TestFunction(V))
+        return self.cached_derivative_form
 
     def value_form(self):
         """UFL formula of misfit functional."""
@@ -36,8 +112,8 @@ class Objective(ROL.Objective):
 
     def value(self, x, tol):
         """Evaluate misfit functional. Function signature imposed by ROL."""
-        return self.scale * fd.assemble(self.value_form(),
-                                        form_compiler_parameters=self.params)
+        return self.scale * self.assemble_form(
+            "value", self.get_value_form(), params=self.params)
 
     def derivative_form(self, v):
         """
@@ -58,8 +134,13 @@ class Objective(ROL.Objective):
         Function signature imposed by ROL.
         """
 
-        self.derivative(g)
-        g.apply_riesz_map()
+        g.set_tolerance(tol)
+        try:
+            self.derivative(g)
+            g.apply_riesz_map()
+        finally:
+            # the inner product is shared, later Riesz maps are exact
+            g.set_tolerance(None)
 
     def update(self, x, flag, iteration):
         """Update physical domain and possibly store current iterate."""
@@ -103,9 +184,8 @@ class ShapeObjective(Objective):
         which is then converted to the directional derivative wrt
         ControSpace perturbations restrict.
         """
-        v = fd.TestFunction(self.V_m)
-        fd.assemble(self.derivative_form(v), tensor=self.deriv_m,
-                    form_compiler_parameters=self.params)
+        self.assemble_form("derivative", self.get_derivative_form(self.V_m),
+                           tensor=self.deriv_m, params=self.params)
         out.from_first_derivative(self.deriv_r)
         out.scale(self.scale)
         # return self.deriv_control
@@ -126,9 +206,8 @@ class DeformationObjective(Objective):
         """
         Assemble partial directional derivative wrt ControlSpace perturbations.
         """
-        v = fd.TestFunction(self.V_r)
-        fd.assemble(self.derivative_form(v), tensor=self.deriv_r,
-                    form_compiler_parameters=self.params)
+        self.assemble_form("derivative", self.get_derivative_form(self.V_r),
+                           tensor=self.deriv_r, params=self.params)
         out.from_first_derivative(self.deriv_r)
         out.scale(self.scale)
 
@@ -152,10 +231,11 @@ class ControlObjective(Objective):
         """
         Assemble partial directional derivative wrt ControlSpace perturbations.
         """
-        v = fd.TestFunction(self.V_control)
-        fd.assemble(self.derivative_form(v), tensor=self.deriv_r,
-                    form_compiler_parameters=self.params)
+        self.assemble_form("derivative",
+                           self.get_derivative_form(self.V_control),
+                           tensor=self.deriv_r, params=self.params)
         out.fun.assign(self.deriv_r)
+        out.mark_modified()
         out.scale(self.scale)
 
     def update(self, x, flag, iteration):
@@ -164,16 +244,97 @@ class ControlObjective(Objective):
 
 
 class ReducedObjective(ShapeObjective):
-    """Abstract class of reduced shape functionals."""
-    def __init__(self, J: Objective, e: PdeConstraint):
+    """
+    Abstract class of reduced shape functionals.
+
+    If memoize > 0, the value, the shape derivative and the state
+    (e.solution, if it exists) of the last memoize controls are kept in a
+    least-recently-used cache keyed on the state id of the control (see
+    ControlVector.state_id). When ROL returns to one of these controls, for
+    instance after a rejected step, the state is restored from the cache
+    instead of solving the PDE again.
+
+    If reuse_tape=True, the state solve is recorded on a pyadjoint tape
+    only once, for the first control. For later controls, the tape is
+    replayed with the perturbation of the mesh coordinates since then, and
+    the new state is copied from the tape to e.solution. This requires
+    that e.solve() performs the same operations for every domain.
+
+    If adjoint="manual", the state equation is not recorded on a tape.
+    Instead, the shape derivative is computed by solving the adjoint
+    equation with e.solve_adjoint and assembling self.derivative_form,
+    see PdeConstraint for the requirements on e.
+
+    For time-dependent constraints, which loop over e.timesteps() in
+    e.solve(), the tape can be checkpointed instead of keeping the states
+    of all e.num_timesteps time steps in memory. The states are then
+    recomputed from the checkpoints during the adjoint sweep, following a
+    revolve schedule. Either checkpoints gives the number of checkpoints
+    kept in memory, or checkpoint_memory the memory budget in bytes for
+    them (estimated from the size of e.solution). If disk_checkpoints > 0,
+    up to this many additional checkpoints are stored on disk, in
+    checkpoint_dir or a temporary directory. Checkpointing uses
+    firedrake.adjoint and requires a version of it that supports
+    checkpoint schedules, as well as the checkpoint_schedules package.
+
+    If predictor="secant", the initial guess for the state solve on a new
+    domain is extrapolated from the states of the last two solves. The
+    new step of the mesh coordinates is projected onto the previous one,
+    and the states are extrapolated linearly with the resulting factor. If
+    the solve does not converge from the predicted state, it is repeated
+    from the last state. The prediction has no effect when the tape is
+    replayed (reuse_tape=True), as the tape does not use e.solution.
+
+    If e.inexact, the state is solved with the tolerance that ROL requested
+    last (see PdeConstraint.set_tolerance). value and gradient solve the
+    state again if ROL requests a tighter tolerance than the one of the
+    current state.
+    """
+    def __init__(self, J: Objective, e: PdeConstraint, memoize=0,
+                 reuse_tape=False, adjoint="pyadjoint", checkpoints=None,
+                 checkpoint_memory=None, disk_checkpoints=0,
+                 checkpoint_dir=None, predictor=None):
         if not isinstance(J, ShapeObjective):
             msg = "PDE constraints are currently only supported"
             + " for shape objectives."
             raise NotImplementedError(msg)
 
+        if adjoint not in ["pyadjoint", "manual"]:
+            raise ValueError("Unknown adjoint '%s'." % adjoint)
+        if adjoint == "manual" and reuse_tape:
+            raise ValueError("reuse_tape requires adjoint='pyadjoint'.")
+        if predictor not in [None, "secant"]:
+            raise ValueError("Unknown predictor '%s'." % predictor)
+        checkpointing = checkpoints is not None \
+            or checkpoint_memory is not None or disk_checkpoints > 0
+        if checkpointing and (reuse_tape or adjoint == "manual"):
+            raise ValueError("Checkpointing requires adjoint='pyadjoint' "
+                             "and reuse_tape=False.")
+
         super().__init__(J.Q, J.cb)
         self.J = J
+        self.adjoint = adjoint
         self.e = e
+        self.memoize = memoize
+        self.memo = OrderedDict()
+        self.entry = None
+        self.Jred = None
+        self.reuse_tape = reuse_tape
+        self.tape_Jred = None
+        # value of J recorded or replayed on the tape
+        self.taped_value = None
+        self.checkpointing = checkpointing
+        self.checkpoints = checkpoints
+        self.checkpoint_memory = checkpoint_memory
+        self.disk_checkpoints = disk_checkpoints
+        self.checkpoint_dir = checkpoint_dir
+        if checkpointing:
+            self.check_checkpointing()
+        self.predictor = predictor
+        # pairs of mesh coordinates and states of the last solves
+        self.history = []
+        # relative tolerance that the current state was solved with
+        self.state_rtol = None
         # stop any annotation that might be ongoing as we only want to record
         # what's happening in e.solve()
         import firedrake_adjoint as fda
@@ -184,14 +345,81 @@ class ReducedObjective(ShapeObjective):
         Evaluate reduced objective.
         Function signature imposed by ROL.
         """
-        return self.J.value(x, tol)
+        self.refine_state(x, tol)
+        if self.entry is not None and self.entry["value"] is not None:
+            return self.entry["value"]
+        if self.taped_value is not None \
+                and type(self.J).value is Objective.value:
+            val = self.J.scale * self.taped_value
+        else:
+            val = self.J.value(x, tol)
+        if self.entry is not None:
+            self.entry["value"] = val
+        return val
+
+    def gradient(self, g, x, tol):
+        """
+        Compute Riesz representative of the reduced shape derivative.
+        Function signature imposed by ROL.
+        """
+        self.refine_state(x, tol)
+        super().gradient(g, x, tol)
+
+    def refine_state(self, x, tol):
+        """
+        Set the tolerance of the state solver to tol, which also applies to
+        the solves of later iterates. If the current state was solved with
+        a looser tolerance, solve it again from the current state.
+        """
+        self.e.set_tolerance(tol)
+        if self.state_rtol is None or self.e.rtol is None \
+                or self.e.rtol >= self.state_rtol:
+            return
+        self.solve_state()
+        self.state_rtol = self.e.rtol
+        self.memoize_state(x)
 
     def derivative(self, out):
         """
-        Get the derivative from pyadjoint.
+        Get the derivative from pyadjoint or from the adjoint equation.
         """
+        # from_first_derivative may overwrite its argument
+        self.deriv_m.assign(self.fe_derivative())
+        out.from_first_derivative(self.deriv_m)
 
-        out.from_first_derivative(self.Jred.derivative())
+    def fe_derivative(self):
+        """
+        Return the shape derivative as fd.Function on self.V_m, including
+        the scale of self.J like self.value. The result must not be
+        modified.
+        """
+        if self.entry is not None and self.entry["derivative"] is not None:
+            return self.entry["derivative"]
+        if self.adjoint == "manual":
+            return self.manual_derivative()
+        if self.Jred is None:
+            # the state was restored from the cache, but not the tape
+            self.record()
+        deriv = self.Jred.derivative()
+        # the tape records the unscaled value form of self.J
+        deriv *= self.J.scale
+        if self.entry is not None:
+            self.entry["derivative"] = deriv.copy(deepcopy=True)
+        return deriv
+
+    def manual_derivative(self):
+        """
+        Solve the adjoint equation and assemble the derivative of the
+        Lagrangian on self.V_m.
+        """
+        self.e.solve_adjoint(self.J.scale * self.J.get_value_form())
+        if not hasattr(self, "deriv_adj"):
+            self.deriv_adj = fd.Function(self.V_m)
+        self.assemble_form("derivative", self.get_derivative_form(self.V_m),
+                           tensor=self.deriv_adj, params=self.J.params)
+        if self.entry is not None:
+            self.entry["derivative"] = self.deriv_adj.copy(deepcopy=True)
+        return self.deriv_adj
 
     def derivative_form(self, v):
         """
@@ -201,75 +429,361 @@ class ReducedObjective(ShapeObjective):
         return self.J.scale * self.J.derivative_form(v) \
             + self.e.derivative_form(v)
 
+    def mark_dirty(self):
+        super().mark_dirty()
+        self.J.mark_dirty()
+
     def update(self, x, flag, iteration):
         """Update domain and solution to state and adjoint equation."""
         if self.Q.update_domain(x):
-            try:
-                # We use pyadjoint to calculate adjoint and shape derivatives,
-                # in order to do this we need to "record a tape of the forward
-                # solve", pyadjoint will then figure out all necessary
-                # adjoints.
-                import firedrake_adjoint as fda
-                tape = fda.get_working_tape()
-                tape.clear_tape()
-                fda.continue_annotation()
-                mesh_m = self.J.Q.mesh_m
-                s = fd.Function(self.J.V_m)
-                mesh_m.coordinates.assign(mesh_m.coordinates + s)
-                self.s = s
-                self.c = fda.Control(s)
-                self.e.solve()
-                Jpyadj = fd.assemble(self.J.value_form())
-                self.Jred = fda.ReducedFunctional(Jpyadj, self.c)
-                fda.pause_annotation()
-            except fd.ConvergenceError:
-                if self.cb is not None:
-                    self.cb()
-                raise
+            entry = self.memo.get(x.state_id)
+            self.e.state_id = x.state_id
+            if entry is not None:
+                self.memo.move_to_end(x.state_id)
+                if entry["state"] is not None:
+                    self.e.solution.assign(entry["state"])
+                self.state_rtol = entry["rtol"]
+                self.entry = entry
+                self.Jred = None
+                self.taped_value = None
+            else:
+                try:
+                    predicted = self.predict_state()
+                    try:
+                        self.solve_state()
+                    except fd.ConvergenceError:
+                        if not predicted:
+                            raise
+                        # try again from the last state
+                        self.e.solution.assign(self.history[-1][1])
+                        self.solve_state()
+                except fd.ConvergenceError:
+                    if self.cb is not None:
+                        self.cb()
+                    raise
+                self.state_rtol = self.e.rtol
+                self.memoize_state(x)
+                self.store_history()
         if iteration >= 0 and self.cb is not None:
             self.cb()
 
+    def solve_state(self):
+        """Solve the state equation, recording it if pyadjoint is used."""
+        if self.adjoint == "manual":
+            self.e.solve()
+        else:
+            self.record()
 
-class ObjectiveSum(Objective):
+    def predict_state(self):
+        """
+        Extrapolate e.solution from the last two solves if
+        predictor="secant". Return whether a prediction was made.
+        """
+        if self.predictor is None or len(self.history) < 2:
+            return False
+        ((T0, u0), (T1, u1)) = self.history
+        with self.Q.T.dat.vec_ro as T, T0.dat.vec_ro as t0, \
+                T1.dat.vec_ro as t1, self.step.dat.vec_wo as step, \
+                self.last_step.dat.vec_wo as last_step:
+            t1.copy(last_step)
+            last_step.axpy(-1., t0)
+            T.copy(step)
+            step.axpy(-1., t1)
+            nrm = last_step.dot(last_step)
+            if nrm == 0:
+                return False
+            theta = step.dot(last_step) / nrm
+        with u0.dat.vec_ro as v0, u1.dat.vec_ro as v1, \
+                self.e.solution.dat.vec_wo as u:
+            v1.copy(u)
+            u.scale(1. + theta)
+            u.axpy(-theta, v0)
+        return True
+
+    def store_history(self):
+        """Store the mesh coordinates and the state of the last solve."""
+        if self.predictor is None:
+            return
+        if len(self.history) < 2:
+            T = self.Q.T.copy(deepcopy=True)
+            u = self.e.solution.copy(deepcopy=True)
+            self.history.append((T, u))
+            if len(self.history) == 2:
+                self.step = self.Q.T.copy(deepcopy=True)
+                self.last_step = self.Q.T.copy(deepcopy=True)
+            return
+        # reuse the functions of the oldest entry
+        (T, u) = self.history.pop(0)
+        with self.Q.T.dat.vec_ro as x, T.dat.vec_wo as y:
+            x.copy(y)
+        with self.e.solution.dat.vec_ro as x, u.dat.vec_wo as y:
+            x.copy(y)
+        self.history.append((T, u))
+
+    def record(self):
+        """Solve the state equation and record it on the pyadjoint tape."""
+        if self.tape_Jred is not None:
+            self.replay()
+            return
+        # We use pyadjoint to calculate adjoint and shape derivatives,
+        # in order to do this we need to "record a tape of the forward
+        # solve", pyadjoint will then figure out all necessary
+        # adjoints.
+        if self.checkpointing:
+            import firedrake.adjoint as fda
+        else:
+            import firedrake_adjoint as fda
+        private_tape = self.reuse_tape or self.checkpointing
+        if private_tape:
+            # record on a separate tape, so that it is not cleared by
+            # other ReducedObjectives
+            tape = fda.Tape()
+            working_tape = fda.get_working_tape()
+            fda.set_working_tape(tape)
+        else:
+            tape = fda.get_working_tape()
+            tape.clear_tape()
+        if self.checkpointing:
+            # checkpointing must be enabled on an empty tape
+            tape.enable_checkpointing(self.get_checkpoint_schedule())
+        fda.continue_annotation()
+        try:
+            mesh_m = self.J.Q.mesh_m
+            s = fd.Function(self.J.V_m)
+            mesh_m.coordinates.assign(mesh_m.coordinates + s)
+            self.s = s
+            self.c = fda.Control(s)
+            self.e.solve()
+            Jpyadj = fd.assemble(self.J.value_form(),
+                                 form_compiler_parameters=self.J.params)
+            self.Jred = fda.ReducedFunctional(Jpyadj, self.c, tape=tape)
+        finally:
+            fda.pause_annotation()
+            if private_tape:
+                fda.set_working_tape(working_tape)
+        self.taped_value = float(Jpyadj)
+        if self.reuse_tape:
+            self.tape_Jred = self.Jred
+            # mesh coordinates on the tape
+            self.T_taped = self.Q.T.copy(deepcopy=True)
+
+    @staticmethod
+    def check_checkpointing():
+        """Raise an ImportError if tape checkpointing is not available."""
+        try:
+            import firedrake.adjoint as fda
+            import checkpoint_schedules  # noqa: F401
+        except ImportError as err:
+            raise ImportError("Checkpointing requires firedrake.adjoint and "
+                              "the checkpoint_schedules package.") from err
+        if not hasattr(fda.Tape, "enable_checkpointing") or \
+                not hasattr(fda, "enable_disk_checkpointing"):
+            raise ImportError("Checkpointing requires a version of "
+                              "firedrake.adjoint that supports checkpoint "
+                              "schedules.")
+
+    def get_checkpoint_schedule(self):
+        """Return the checkpoint schedule for the time steps of self.e."""
+        from checkpoint_schedules import Revolve, MultistageCheckpointSchedule
+        n = self.e.num_timesteps
+        if n is None:
+            raise ValueError("Checkpointing requires a PdeConstraint with "
+                             "num_timesteps.")
+        snapshots = self.checkpoints
+        if self.checkpoint_memory is not None:
+            # the state may live on a mixed space
+            nbytes = sum(d.data_ro.nbytes for d in self.e.solution.dat)
+            snapshots = int(self.checkpoint_memory // nbytes)
+        if snapshots is None:
+            snapshots = 0
+        snapshots = min(snapshots, n)
+        if self.disk_checkpoints > 0:
+            from firedrake.adjoint import enable_disk_checkpointing
+            enable_disk_checkpointing(dirname=self.checkpoint_dir)
+            return MultistageCheckpointSchedule(n, snapshots,
+                                                self.disk_checkpoints)
+        if snapshots < 1:
+            raise ValueError("The checkpoint memory does not suffice for "
+                             "one checkpoint.")
+        return Revolve(n, snapshots)
+
+    def replay(self):
+        """
+        Solve the state equation by replaying the tape with the
+        perturbation of the mesh coordinates since it was recorded.
+        """
+        with self.s.dat.vec_wo as s, self.Q.T.dat.vec_ro as T, \
+                self.T_taped.dat.vec_ro as T_taped:
+            T.copy(s)
+            s.axpy(-1., T_taped)
+        try:
+            self.taped_value = float(self.tape_Jred(self.s))
+        except fd.ConvergenceError:
+            # the tape may be in an inconsistent state, record a new one
+            self.tape_Jred = None
+            raise
+        self.Jred = self.tape_Jred
+        self.e.num_solves += 1
+        # replaying only updates the values on the tape
+        state = getattr(self.e, "solution", None)
+        if state is not None:
+            state.assign(state.block_variable.saved_output)
+
+    def memoize_state(self, x):
+        """Start a new cache entry for the control x."""
+        if self.memoize <= 0:
+            return
+        state = getattr(self.e, "solution", None)
+        if state is not None:
+            state = state.copy(deepcopy=True)
+        self.entry = {"value": None, "derivative": None, "state": state,
+                      "rtol": self.state_rtol}
+        self.memo[x.state_id] = self.entry
+        if len(self.memo) > self.memoize:
+            self.memo.popitem(last=False)
+
+
+class ObjectiveCombination(Objective):
+    """
+    Linear combination of objectives, stored as the flat list self.terms
+    of pairs (weight, objective), where no objective is an
+    ObjectiveCombination itself.
+
+    The terms are evaluated together. The value forms of all shape,
+    deformation and control objectives with the same quadrature degree
+    are added and assembled at once, and so are their derivative forms.
+    The derivatives on self.V_r and self.V_m (including those of reduced
+    objectives) are added before they are restricted to the ControlSpace,
+    so that a boundary extension is only solved once per derivative.
+    Other objectives are evaluated separately.
+    """
+
+    def __init__(self, terms):
+        super().__init__(terms[0][1].Q)
+        self.terms = terms
+        self.groups = None
+
+    def get_groups(self):
+        """
+        Sort the terms into fused groups of shape, deformation and control
+        objectives, reduced objectives and other objectives.
+        """
+        if self.groups is not None:
+            return self.groups
+        kinds = [("shape", ShapeObjective), ("deformation",
+                                             DeformationObjective),
+                 ("control", ControlObjective)]
+        fused = {}
+        reduced = []
+        other = []
+        for (w, J) in self.terms:
+            if isinstance(J, ReducedObjective):
+                reduced.append((w, J))
+                continue
+            for (kind, cls) in kinds:
+                if isinstance(J, cls) and J.cache_forms \
+                        and type(J).value is Objective.value \
+                        and type(J).derivative is cls.derivative:
+                    params = J.params
+                    key = (kind, None if params is None
+                           else tuple(sorted(params.items())))
+                    fused.setdefault(key, []).append((w, J))
+                    break
+            else:
+                other.append((w, J))
+        groups = []
+        for ((kind, _), terms) in fused.items():
+            J = terms[0][1]
+            V = {"shape": J.V_m, "deformation": J.V_r,
+                 "control": J.Q.get_space_for_inner()[0]}[kind]
+            value_form = sum((w * J.scale) * J.get_value_form()
+                             for (w, J) in terms)
+            derivative_form = sum((w * J.scale) * J.get_derivative_form(V)
+                                  for (w, J) in terms)
+            tensor = fd.Function(V)
+            groups.append({"kind": kind, "tensor": tensor,
+                           "value": make_assembler(value_form, None,
+                                                   J.params),
+                           "derivative": make_assembler(derivative_form,
+                                                        tensor, J.params)})
+        self.groups = (groups, reduced, other)
+        return self.groups
+
+    def value(self, x, tol):
+        (groups, reduced, other) = self.get_groups()
+        val = 0
+        for group in groups:
+            val += group["value"]()
+        for (w, J) in reduced + other:
+            val += w * J.value(x, tol)
+        return val
+
+    def derivative(self, out):
+        (groups, reduced, other) = self.get_groups()
+        fe_derivs = []
+        control_derivs = []
+        for group in groups:
+            group["derivative"]()
+            if group["kind"] == "control":
+                control_derivs.append((1., group["tensor"]))
+            else:
+                fe_derivs.append((1., group["tensor"]))
+        for (w, J) in reduced:
+            fe_derivs.append((w, J.fe_derivative()))
+
+        if len(fe_derivs) > 0:
+            with self.deriv_r.dat.vec_wo as acc:
+                acc.set(0.)
+                for (w, deriv) in fe_derivs:
+                    with deriv.dat.vec_ro as v:
+                        acc.axpy(w, v)
+            out.from_first_derivative(self.deriv_r)
+        else:
+            out.vec_wo().set(0.)
+        for (w, deriv) in control_derivs:
+            with deriv.dat.vec_ro as v:
+                out.vec_wo().axpy(w, v)
+        if len(other) > 0:
+            temp = out.clone()
+            for (w, J) in other:
+                J.derivative(temp)
+                out.axpy(w, temp)
+
+    def mark_dirty(self):
+        super().mark_dirty()
+        self.groups = None
+        for (w, J) in self.terms:
+            J.mark_dirty()
+
+    def update(self, *args):
+        for (w, J) in self.terms:
+            J.update(*args)
+
+
+def weighted_terms(J, alpha=1.0):
+    """Return J * alpha as a list of pairs (weight, objective)."""
+    if isinstance(J, ObjectiveCombination):
+        return [(alpha * w, J_) for (w, J_) in J.terms]
+    return [(alpha, J)]
+
+
+class ObjectiveSum(ObjectiveCombination):
 
     def __init__(self, a, b):
-        super().__init__(a.Q)
+        super().__init__(weighted_terms(a) + weighted_terms(b))
         self.a = a
         self.b = b
 
-    def value(self, x, tol):
-        return self.a.value(x, tol) + self.b.value(x, tol)
-
     def value_form(self):
         return self.a.value_form() + self.b.value_form()
 
-    def derivative(self, out):
-        temp = out.clone()
-        self.a.derivative(out)
-        self.b.derivative(temp)
-        out.plus(temp)
-
     def derivative_form(self, v):
         return self.a.derivative_form(v) + self.b.derivative_form(v)
 
-    def update(self, *args):
-        self.a.update(*args)
-        self.b.update(*args)
-
 
-class ScaledObjective(Objective):
+class ScaledObjective(ObjectiveCombination):
 
     def __init__(self, J, alpha):
-        super().__init__(J.Q)
+        super().__init__(weighted_terms(J, alpha))
         self.J = J
         self.alpha = alpha
-
-    def value(self, *args):
-        return self.alpha * self.J.value(*args)
-
-    def derivative(self, out):
-        self.J.derivative(out)
-        out.scale(self.alpha)
-
-    def update(self, *args):
-        self.J.update(*args)
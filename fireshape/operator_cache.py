@@ -0,0 +1,116 @@
+import hashlib
+import os
+from firedrake.petsc import PETSc
+
+__all__ = ["OperatorCache"]
+
+
+class OperatorCache(object):
+    """
+    Content-addressed on-disk cache for PETSc matrices and vectors.
+
+    Operators are stored in PETSc binary format under a key that is the
+    hash of the mesh (coordinates and topology on every rank) and of the
+    parameters used to construct them. If any of these change, the key
+    changes and the operator is rebuilt, so stale files are never read.
+    Since the key includes the parallel decomposition, operators are
+    reloaded with the same row and column distribution they were
+    stored with.
+
+    Usage:
+        cache = fs.OperatorCache("cache_dir")
+        Q = fs.BsplineControlSpace(mesh, bbox, orders, levels, cache=cache)
+        inner = fs.H1InnerProduct(Q, cache=cache)
+    """
+
+    version = 1
+
+    def __init__(self, directory="fireshape_cache"):
+        self.directory = directory
+
+    def key(self, mesh, *params):
+        """
+        Return the key of an operator that depends on mesh and on params.
+
+        params must have a deterministic repr.
+        """
+        comm = mesh.mpi_comm()
+        local_hash = hashlib.sha1()
+        local_hash.update(mesh.coordinates.dat.data_ro.tobytes())
+        V = mesh.coordinates.function_space()
+        local_hash.update(V.cell_node_list.tobytes())
+        hashes = comm.allgather(local_hash.hexdigest())
+
+        key = hashlib.sha1()
+        key.update(repr((self.version, comm.size, hashes,
+                         params)).encode())
+        return key.hexdigest()
+
+    def filename(self, key, name):
+        return os.path.join(self.directory, "%s_%s.dat" % (name, key))
+
+    def exists(self, filename, comm):
+        exists = os.path.exists(filename) if comm.rank == 0 else None
+        return comm.bcast(exists, root=0)
+
+    def load_mat(self, key, name, sizes, comm):
+        """
+        Load the matrix stored under (key, name) with the given sizes.
+        Returns None if there is no such matrix.
+        """
+        filename = self.filename(key, name)
+        if not self.exists(filename, comm):
+            return None
+        viewer = PETSc.Viewer().createBinary(filename, mode="r", comm=comm)
+        A = PETSc.Mat().create(comm=comm)
+        A.setSizes(sizes)
+        A.setType(PETSc.Mat.Type.AIJ)
+        A.load(viewer)
+        return A
+
+    def store_mat(self, key, name, A):
+        """Store the matrix A under (key, name)."""
+        self.store(key, name, A, A.getComm().tompi4py())
+
+    def load_vec(self, key, name, vec):
+        """
+        Load the vector stored under (key, name) into vec.
+        Returns False if there is no such vector.
+        """
+        comm = vec.getComm().tompi4py()
+        filename = self.filename(key, name)
+        if not self.exists(filename, comm):
+            return False
+        viewer = PETSc.Viewer().createBinary(filename, mode="r", comm=comm)
+        vec.load(viewer)
+        return True
+
+    def store_vec(self, key, name, vec):
+        """Store the vector vec under (key, name)."""
+        self.store(key, name, vec, vec.getComm().tompi4py())
+
+    def store(self, key, name, obj, comm):
+        # write to a temporary file first so that concurrent runs never
+        # read a partially written operator
+        filename = self.filename(key, name)
+        tmpname = filename + ".tmp"
+        if comm.rank == 0:
+            os.makedirs(self.directory, exist_ok=True)
+        comm.barrier()
+        viewer = PETSc.Viewer().createBinary(tmpname, mode="w", comm=comm)
+        viewer.view(obj)
+        viewer.destroy()
+        comm.barrier()
+        if comm.rank == 0:
+            os.replace(tmpname, filename)
+        comm.barrier()
+
+    def load_function(self, key, name, fun):
+        """Load the fd.Function stored under (key, name) into fun."""
+        with fun.dat.vec_wo as vec:
+            return self.load_vec(key, name, vec)
+
+    def store_function(self, key, name, fun):
+        """Store the fd.Function fun under (key, name)."""
+        with fun.dat.vec_ro as vec:
+            self.store_vec(key, name, vec)
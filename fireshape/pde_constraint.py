@@ -1,12 +1,204 @@
+import firedrake as fd
+import ufl
+from .tolerance import inexact_rtol
+
+
 class PdeConstraint(object):
     """
     Base class for PdeConstraint.
+
+    The adjoint equation and the shape derivative of the Lagrangian can
+    be computed without pyadjoint (see solve_adjoint and derivative_form).
+    This requires that the PdeConstraint stores the residual form of the
+    state equation in self.F, the state in self.solution and the Dirichlet
+    boundary conditions (or None) in self.bcs. If the state is computed
+    with a fd.NonlinearVariationalSolver stored in self.solver and an LU or
+    Cholesky preconditioner, its factorization is reused for the adjoint,
+    provided that it belongs to the current state (see state_id) and that
+    the problem has no nullspace self.nsp.
+
+    Constraints that solve self.F == 0 with the boundary conditions
+    self.bcs and the solver parameters self.params can call create_solver
+    once and run_solver in solve. The same fd.NonlinearVariationalSolver
+    is then used for all domains, and each solve starts from the previous
+    state.
+
+    Time-dependent constraints set self.num_timesteps and loop over
+    self.timesteps() in solve, so that ReducedObjective can checkpoint the
+    pyadjoint tape.
     """
 
-    def __init__(self):
-        """Set counters of state/adjoint solves to 0."""
+    num_timesteps = None
+
+    # ReducedObjective sets state_id to the state id of the control whose
+    # domain the current state belongs to. run_solver records in
+    # factorization_id the state_id of the solve that last factorized the
+    # Jacobian in self.solver.
+    state_id = None
+    factorization_id = None
+    # relative tolerance of the state solver set by set_tolerance, or None
+    # if it was never changed
+    rtol = None
+
+    def __init__(self, inexact=False):
+        """
+        Set counters of state/adjoint solves to 0.
+
+        If inexact=True, the tolerance of the state solver is adapted to the
+        accuracy requested by ROL (see set_tolerance).
+        """
         self.num_solves = 0
+        self.inexact = inexact
+
+    def set_tolerance(self, tol):
+        """
+        Set the relative tolerance of the state solver to match the
+        accuracy tol requested by ROL. This applies to self.solver (a
+        fd.NonlinearVariationalSolver) and to the solver parameters
+        self.params, if the PdeConstraint defines them. If tol is None, the
+        state is solved as accurately as inexact_rtol allows.
+        """
+        if not self.inexact:
+            return
+        rtol = inexact_rtol(0. if tol is None else tol)
+        self.rtol = rtol
+        solver = getattr(self, "solver", None)
+        if solver is not None:
+            solver.snes.setTolerances(rtol=rtol)
+            solver.snes.ksp.setTolerances(rtol=rtol)
+        params = getattr(self, "params", None)
+        if isinstance(params, dict):
+            params["snes_rtol"] = rtol
+            params["ksp_rtol"] = rtol
 
     def solve(self):
         """Abstract method that solves state equation."""
         self.num_solves += 1
+
+    def create_solver(self, **kwargs):
+        """
+        Create the persistent solver self.solver for self.F == 0. Keyword
+        arguments, such as nullspace, are passed on to the solver.
+
+        The solver remains valid when the mesh coordinates change, so its
+        problem, SNES, KSP and sparsity pattern are only built once.
+        """
+        problem = fd.NonlinearVariationalProblem(self.F, self.solution,
+                                                 bcs=self.bcs)
+        self.solver = fd.NonlinearVariationalSolver(
+            problem, solver_parameters=self.params, **kwargs)
+        self.last_converged = self.solution.copy(deepcopy=True)
+        self.solver_stats = {"solves": 0, "failures": 0,
+                             "factorizations": 0, "nonlinear_its": 0,
+                             "linear_its": 0}
+
+    def run_solver(self):
+        """
+        Solve the state equation with self.solver, using the current
+        solution as initial guess. If the solver does not converge, the
+        last converged solution is restored before the fd.ConvergenceError
+        is raised again, so that the next solve starts from it.
+
+        The number of solves, failures, factorizations, nonlinear and
+        linear iterations are accumulated in self.solver_stats.
+        """
+        stats = self.solver_stats
+        stats["solves"] += 1
+        snes = self.solver.snes
+        # the factorization is overwritten by the solve
+        self.factorization_id = None
+        try:
+            self.solver.solve()
+        except fd.ConvergenceError:
+            stats["failures"] += 1
+            with self.last_converged.dat.vec_ro as x, \
+                    self.solution.dat.vec_wo as y:
+                x.copy(y)
+            raise
+        finally:
+            stats["nonlinear_its"] += snes.getIterationNumber()
+            stats["linear_its"] += snes.getLinearSolveIterations()
+        with self.solution.dat.vec_ro as x, \
+                self.last_converged.dat.vec_wo as y:
+            x.copy(y)
+        if snes.getIterationNumber() > 0:
+            # without Newton steps, the Jacobian is not factorized
+            stats["factorizations"] += 1
+            self.factorization_id = self.state_id
+
+    def timesteps(self):
+        """
+        Iterate over the time steps 0, ..., self.num_timesteps-1. While the
+        solve is recorded, the time steps are marked on the pyadjoint tape.
+        """
+        steps = iter(range(self.num_timesteps))
+        try:
+            from firedrake.adjoint import annotate_tape, get_working_tape
+        except ImportError:
+            # without firedrake.adjoint, the tape cannot be checkpointed
+            return steps
+        tape = get_working_tape()
+        if annotate_tape() and hasattr(tape, "timestepper"):
+            steps = tape.timestepper(steps)
+        return steps
+
+    def get_adjoint(self):
+        """Return the fd.Function that stores the adjoint state."""
+        if not hasattr(self, "adjoint"):
+            self.adjoint = fd.Function(self.solution.function_space(),
+                                       name="Adjoint")
+        return self.adjoint
+
+    def solve_adjoint(self, J_form):
+        """
+        Solve the adjoint equation dF/du^T * adjoint = -dJ/du, where J_form
+        is the UFL form of the objective, and return the adjoint state.
+
+        If the forward solver factorized the Jacobian on the domain of the
+        current state, the factorization is reused. For nonlinear problems,
+        this factorization belongs to the last Newton iterate but one,
+        which is exact up to the tolerance of the Newton solver. Otherwise,
+        for instance if the state was restored from a cache, the adjoint
+        operator is assembled and solved for.
+        """
+        u = self.solution
+        V = u.function_space()
+        adjoint = self.get_adjoint()
+        rhs = fd.assemble(-fd.derivative(J_form, u, fd.TestFunction(V)))
+        bcs = getattr(self, "bcs", None)
+        if isinstance(bcs, fd.DirichletBC):
+            bcs = [bcs]
+        if bcs is not None:
+            bcs = fd.homogenize(bcs)
+            for bc in bcs:
+                bc.zero(rhs)
+
+        solver = getattr(self, "solver", None)
+        nsp = getattr(self, "nsp", None)
+        pc = None
+        if solver is not None and nsp is None \
+                and self.factorization_id is not None \
+                and self.factorization_id == self.state_id:
+            pc = solver.snes.ksp.pc
+            if pc.getType() not in ["lu", "cholesky"]:
+                pc = None
+        if pc is not None:
+            with rhs.dat.vec_ro as b, adjoint.dat.vec_wo as x:
+                pc.applyTranspose(b, x)
+        else:
+            dFdu = fd.derivative(self.F, u, fd.TrialFunction(V))
+            A = fd.assemble(fd.adjoint(dFdu), bcs=bcs)
+            params = getattr(self, "params", None)
+            fd.solve(A, adjoint, rhs, solver_parameters=params,
+                     nullspace=nsp, transpose_nullspace=nsp)
+        return adjoint
+
+    def derivative_form(self, v):
+        """
+        UFL formula of the shape derivative of the state equation tested
+        with the adjoint state, that is, of the PDE part of the Lagrangian.
+        """
+        test = self.F.arguments()[0]
+        F_adjoint = ufl.replace(self.F, {test: self.get_adjoint()})
+        X = fd.SpatialCoordinate(self.solution.ufl_domain())
+        return fd.derivative(F_adjoint, X, v)
@@ -0,0 +1,10 @@
+def inexact_rtol(tol, rtol_min=1e-11, rtol_max=1e-2):
+    """
+    Relative tolerance of an inner solve for an evaluation that ROL
+    requests with accuracy tol.
+
+    The tolerance is clamped to [rtol_min, rtol_max], so that solves are
+    never more accurate than the default exact solves, and never so
+    inaccurate that the result is meaningless.
+    """
+    return min(max(tol, rtol_min), rtol_max)
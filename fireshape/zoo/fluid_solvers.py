@@ -9,7 +9,7 @@ class FluidSolver(PdeConstraint):
 
     def __init__(self, mesh_m, mini=False, direct=True,
                  inflow_bids=[], inflow_expr=None,
-                 noslip_bids=[], nu=1.0):
+                 noslip_bids=[], nu=1.0, inexact=False):
         """
         Instantiate a FluidSolver.
 
@@ -22,8 +22,10 @@ class FluidSolver(PdeConstraint):
             noslip_bids: typ list (of ints), list of bdries with homogeneous
                          Dirichlet bdry condition for velocity
             nu: type float, viscosity
+            inexact: type bool, set to True to adapt the solver tolerance
+                     to the accuracy requested by ROL
         """
-        super().__init__()
+        super().__init__(inexact=inexact)
         self.mesh_m = mesh_m
         self.mini = mini
         self.direct = direct
@@ -49,16 +51,11 @@ class FluidSolver(PdeConstraint):
         self.bcs = self.get_boundary_conditions()
         self.nsp = self.get_nullspace()
         self.params = self.get_parameters()
-        # problem = fd.NonlinearVariationalProblem(self.F, self.solution,
-        #                                           bcs=self.bcs,)
-        # self.solver = fd.NonlinearVariationalSolver(
-        #     problem, solver_parameters=self.params, nullspace=self.nsp)
+        self.create_solver(nullspace=self.nsp, transpose_nullspace=self.nsp)
 
     def solve(self):
         super().solve()
-        # self.solver.solve()
-        fd.solve(self.F == 0, self.solution, bcs=self.bcs,
-                 solver_parameters=self.params, nullspace=self.nsp)
+        self.run_solver()
 
     def get_functionspace(self):
         """Construct trial/test space for state and adjoint equations."""
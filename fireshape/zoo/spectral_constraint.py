@@ -8,6 +8,9 @@ __all__ = ["MoYoSpectralConstraint"]
 
 class MoYoSpectralConstraint(fs.DeformationObjective):
 
+    # value_form and derivative_form update the state
+    cache_forms = False
+
     def __init__(self, c, bound, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.c = c
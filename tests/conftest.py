@@ -0,0 +1,17 @@
+import pytest
+import fireshape as fs
+
+
+@pytest.fixture
+def make_controlspace():
+    """
+    Return a function that builds a ControlSpace of type controlspace_t on
+    mesh. BsplineControlSpaces use quadratic splines on the given levels
+    that cover the bounding box bbox.
+    """
+    def make(controlspace_t, mesh, bbox=[(-0.01, 1.01), (-0.01, 1.01)],
+             levels=[2, 2]):
+        if controlspace_t == fs.BsplineControlSpace:
+            return controlspace_t(mesh, bbox, [2, 2], levels)
+        return controlspace_t(mesh)
+    return make
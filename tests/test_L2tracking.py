@@ -8,7 +8,7 @@ import ROL
 
 class PoissonSolver(PdeConstraint):
     """A Poisson BVP with hom DirBC as PDE constraint."""
-    def __init__(self, mesh_m):
+    def __init__(self, mesh_m, direct=False):
         super().__init__()
         self.mesh_m = mesh_m
 
@@ -35,15 +35,14 @@ class PoissonSolver(PdeConstraint):
             "ksp_atol": 1e-11,
             "ksp_stol": 1e-15,
         }
+        if direct:
+            self.params = {"ksp_type": "preonly", "pc_type": "lu"}
 
-        stateproblem = fd.NonlinearVariationalProblem(
-            self.F, self.solution, bcs=self.bcs)
-        self.solver = fd.NonlinearVariationalSolver(
-            stateproblem, solver_parameters=self.params)
+        self.create_solver()
 
     def solve(self):
         super().solve()
-        self.solver.solve()
+        self.run_solver()
 
 
 class L2trackingObjective(ShapeObjective):
@@ -63,7 +62,8 @@ class L2trackingObjective(ShapeObjective):
         return (u - self.u_target)**2 * fd.dx
 
 
-def run_L2tracking_optimization(write_output=False):
+def run_L2tracking_optimization(write_output=False, reuse_tape=False,
+                                adjoint="pyadjoint", predictor=None):
     """ Test template for fsz.LevelsetFunctional."""
 
     # tool for developing new tests, allows storing shape iterates
@@ -89,7 +89,8 @@ def run_L2tracking_optimization(write_output=False):
 
     # create PDEconstrained objective functional
     J_ = L2trackingObjective(e, Q, cb=cb)
-    J = fs.ReducedObjective(J_, e)
+    J = fs.ReducedObjective(J_, e, reuse_tape=reuse_tape, adjoint=adjoint,
+                            predictor=predictor)
 
     # ROL parameters
     params_dict = {
@@ -125,9 +126,159 @@ def run_L2tracking_optimization(write_output=False):
     assert (state.gnorm < 1e-4)
 
 
-def test_L2tracking(pytestconfig):
+@pytest.mark.parametrize("reuse_tape, adjoint, predictor",
+                         [(False, "pyadjoint", None),
+                          (True, "pyadjoint", None),
+                          (False, "manual", None),
+                          (False, "pyadjoint", "secant")])
+def test_L2tracking(reuse_tape, adjoint, predictor, pytestconfig):
     verbose = False
-    run_L2tracking_optimization(write_output=verbose)
+    run_L2tracking_optimization(write_output=verbose, reuse_tape=reuse_tape,
+                                adjoint=adjoint, predictor=predictor)
+
+
+@pytest.mark.parametrize("direct", [False, True])
+@pytest.mark.parametrize("scale", [1., 2.5])
+def test_L2tracking_manual_adjoint(direct, scale):
+    """ Check the hand-coded adjoint against pyadjoint."""
+
+    def gradient(adjoint):
+        mesh = fd.UnitSquareMesh(10, 10)
+        Q = fs.FeControlSpace(mesh)
+        inner = fs.ElasticityInnerProduct(Q)
+        q = fs.ControlVector(Q, inner)
+        X = fd.SpatialCoordinate(mesh)
+        q.fun.interpolate(0.1 * fd.as_vector([X[1] * X[1], X[0] * X[1]]))
+        e = PoissonSolver(Q.mesh_m, direct=direct)
+        J = fs.ReducedObjective(L2trackingObjective(e, Q, scale=scale), e,
+                                adjoint=adjoint)
+        J.update(q, None, -1)
+        g = q.clone()
+        J.gradient(g, q, None)
+        return (J.value(q, None), g.vec_ro().copy())
+
+    (val1, g1) = gradient("pyadjoint")
+    (val2, g2) = gradient("manual")
+    assert abs(val2 - val1) < 1e-12 * abs(val1)
+    assert (g2 - g1).norm() < 1e-8 * g1.norm()
+
+
+def test_L2tracking_memoize():
+    """ Check that revisiting a control restores the cached state."""
+
+    mesh = fd.UnitSquareMesh(10, 10)
+    Q = fs.FeControlSpace(mesh)
+    inner = fs.ElasticityInnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+    e = PoissonSolver(Q.mesh_m)
+    J = fs.ReducedObjective(L2trackingObjective(e, Q), e, memoize=2)
+
+    J.update(q, None, -1)
+    val = J.value(q, None)
+    g = q.clone()
+    J.gradient(g, q, None)
+    state = e.solution.copy(deepcopy=True)
+
+    p = q.clone()
+    p.set(q)
+    p.axpy(-0.1, g)
+    J.update(p, None, -1)
+    assert abs(J.value(p, None) - val) > 1e-10
+    assert e.num_solves == 2
+
+    # returning to q does not solve the PDE again
+    p.set(q)
+    J.update(p, None, -1)
+    assert e.num_solves == 2
+    assert e.solver_stats["solves"] == 2
+    assert J.value(p, None) == val
+    assert fd.errornorm(state, e.solution) < 1e-14
+    h = q.clone()
+    J.gradient(h, p, None)
+    h.axpy(-1., g)
+    assert h.norm() < 1e-12 * g.norm()
+
+
+def test_L2tracking_inexact():
+    """ Check that the state is solved again for a tighter tolerance."""
+
+    mesh = fd.UnitSquareMesh(10, 10)
+    Q = fs.FeControlSpace(mesh)
+    inner = fs.ElasticityInnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+    e = PoissonSolver(Q.mesh_m)
+    e.inexact = True
+    J = fs.ReducedObjective(L2trackingObjective(e, Q), e, memoize=2,
+                            adjoint="manual")
+
+    J.update(q, None, -1)
+    J.value(q, 1e-2)
+    assert e.solver_stats["solves"] == 1
+
+    # the next state is solved with the loose tolerance
+    p = q.clone()
+    X = fd.SpatialCoordinate(mesh)
+    p.fun.interpolate(0.1 * fd.as_vector([X[1] * X[1], X[0] * X[1]]))
+    p.mark_modified()
+    J.update(p, None, -1)
+    val_loose = J.value(p, 1e-2)
+    assert e.solver_stats["solves"] == 2
+    val = J.value(p, 1e-8)
+    assert e.solver_stats["solves"] == 3
+    J.value(p, 1e-6)
+    assert e.solver_stats["solves"] == 3
+    assert val != val_loose
+
+    e_ref = PoissonSolver(Q.mesh_m)
+    J_ref = fs.ReducedObjective(L2trackingObjective(e_ref, Q), e_ref,
+                                adjoint="manual")
+    J_ref.update(q, None, -1)
+    J_ref.update(p, None, -1)
+    val_ref = J_ref.value(p, None)
+    assert abs(val - val_ref) < 1e-6 * abs(val_ref)
+
+
+def test_L2tracking_memoize_manual_adjoint():
+    """
+    Check that the hand-coded adjoint of a revisited control does not use
+    the factorization of another domain.
+    """
+
+    mesh = fd.UnitSquareMesh(10, 10)
+    Q = fs.FeControlSpace(mesh)
+    inner = fs.ElasticityInnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+    e = PoissonSolver(Q.mesh_m, direct=True)
+    J = fs.ReducedObjective(L2trackingObjective(e, Q), e, memoize=2,
+                            adjoint="manual")
+
+    J.update(q, None, -1)
+    p = q.clone()
+    X = fd.SpatialCoordinate(mesh)
+    p.fun.interpolate(0.1 * fd.as_vector([X[1] * X[1], X[0] * X[1]]))
+    p.mark_modified()
+    J.update(p, None, -1)
+    g = q.clone()
+    J.gradient(g, p, None)
+
+    # the gradient at q was not computed before returning to it
+    J.update(q, None, -1)
+    assert e.solver_stats["solves"] == 2
+    h = q.clone()
+    J.gradient(h, q, None)
+
+    e_ref = PoissonSolver(Q.mesh_m, direct=True)
+    J_ref = fs.ReducedObjective(L2trackingObjective(e_ref, Q), e_ref,
+                                adjoint="manual")
+    J_ref.update(p, None, -1)
+    J_ref.update(q, None, -1)
+    h_ref = q.clone()
+    J_ref.gradient(h_ref, q, None)
+    assert e_ref.factorization_id == e_ref.state_id
+    h.axpy(-1., h_ref)
+    assert h.norm() < 1e-10 * h_ref.norm()
+    g.axpy(-1., h_ref)
+    assert g.norm() > 1e-3 * h_ref.norm()
 
 
 if __name__ == '__main__':
@@ -63,3 +63,11 @@ def test_regularization(controlspace_t, use_extension):
     if isinstance(Q, fs.FeMultiGridControlSpace):
         check_result(run_taylor_test(J4))
     check_result(run_taylor_test(Js))
+
+    # the fused evaluation of Js agrees with the evaluation of its terms
+    Js.update(q, None, 1)
+    ref = 0.1 * J1.value(q, None) + J2.value(q, None) \
+        + 2. * J3.value(q, None)
+    if isinstance(Q, fs.FeMultiGridControlSpace):
+        ref += 2. * J4.value(q, None)
+    assert abs(Js.value(q, None) - ref) < 1e-12 * abs(ref)
@@ -0,0 +1,38 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+import numpy as np
+from scipy.interpolate import splev
+
+
+@pytest.mark.parametrize("order", [2, 3, 4])
+@pytest.mark.parametrize("boundary_regularity", [0, 1])
+def test_bspline_basis(order, boundary_regularity):
+    """ Compare fs.BsplineControlSpace.evaluate_univariate_bsplines
+    with scipy.interpolate.splev."""
+
+    mesh = fd.UnitSquareMesh(2, 2)
+    bbox = [(-1, 2), (-1, 2)]
+    orders = [order, order]
+    levels = [3, 3]
+    regularities = [boundary_regularity] * 2
+    Q = fs.BsplineControlSpace(mesh, bbox, orders, levels,
+                               boundary_regularities=regularities)
+
+    knots = Q.knots[0]
+    x = np.concatenate([np.linspace(-1.5, 2.5, 101), knots])
+    cols, vals = Q.evaluate_univariate_bsplines(x, 0)
+    values = np.zeros((len(x), Q.n[0]))
+    for i in range(len(x)):
+        np.add.at(values[i], cols[i], vals[i])
+
+    for idx in range(Q.n[0]):
+        coeffs = np.zeros(knots.shape, dtype=float)
+        coeffs[idx + regularities[0]] = 1
+        tck = (knots, coeffs, order - 1)
+        expected = splev(x, tck, der=0, ext=1)
+        assert np.allclose(values[:, idx], expected, atol=1e-14)
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,56 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+from firedrake.petsc import PETSc
+
+
+@pytest.mark.parametrize("dim", [2, 3])
+@pytest.mark.parametrize("fixed_dims", [[], [1]])
+@pytest.mark.parametrize("matfree", [False, True])
+def test_bspline_matfree(dim, fixed_dims, matfree):
+    """ Compare the shell interpolation matrices of fs.BsplineControlSpace
+    with the assembled interpolation matrix."""
+
+    if dim == 2:
+        mesh = fd.UnitSquareMesh(5, 5)
+        bbox = [(-1, 2), (-1, 2)]
+        orders = [3, 2]
+        levels = [3, 4]
+    else:
+        mesh = fd.UnitCubeMesh(3, 3, 3)
+        bbox = [(-1, 2), (-1, 2), (-1, 2)]
+        orders = [2, 3, 2]
+        levels = [2, 3, 3]
+    Q = fs.BsplineControlSpace(mesh, bbox, orders, levels,
+                               fixed_dims=fixed_dims, matfree=matfree)
+    FullIFW = Q.build_interpolation_matrix(Q.V_r)
+    if not matfree and fixed_dims == []:
+        # all components are interpolated by one blocked product
+        assert Q.FullIFW.getType().endswith("baij")
+
+    rand = PETSc.Random().create(mesh.comm)
+    rand.setInterval((-1, 1))
+
+    x = FullIFW.createVecRight()
+    x.setRandom(rand)
+    y = FullIFW.createVecLeft()
+    y_shell = Q.FullIFW.createVecLeft()
+    FullIFW.mult(x, y)
+    Q.FullIFW.mult(x, y_shell)
+    y_shell.axpy(-1., y)
+    assert y.norm() > 0
+    assert y_shell.norm() < 1e-12 * y.norm()
+
+    w = FullIFW.createVecLeft()
+    w.setRandom(rand)
+    z = FullIFW.createVecRight()
+    z_shell = Q.FullIFW.createVecRight()
+    FullIFW.multTranspose(w, z)
+    Q.FullIFW.multTranspose(w, z_shell)
+    z_shell.axpy(-1., z)
+    assert z.norm() > 0
+    assert z_shell.norm() < 1e-12 * z.norm()
+
+
+if __name__ == '__main__':
+    pytest.main()
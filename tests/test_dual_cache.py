@@ -0,0 +1,82 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+import fireshape.zoo as fsz
+from firedrake.petsc import PETSc
+
+
+@pytest.mark.parametrize("inner_t", [fs.H1InnerProduct,
+                                     fs.SurfaceInnerProduct])
+def test_dual_cache(inner_t):
+    """ Check that the cached dual representation of ControlVectors stays
+    consistent with the inner product under linear updates."""
+
+    mesh = fd.UnitSquareMesh(5, 5)
+    Q = fs.FeControlSpace(mesh)
+    inner = inner_t(Q)
+    rand = PETSc.Random().create(mesh.comm)
+    u = fs.ControlVector(Q, inner)
+    v = fs.ControlVector(Q, inner)
+    w = fs.ControlVector(Q, inner)
+    u.vec_wo().setRandom(rand)
+    v.vec_wo().setRandom(rand)
+    w.vec_wo().setRandom(rand)
+
+    def check():
+        for (a, b) in [(u, v), (v, w), (w, u), (u, u)]:
+            ref = inner.eval(a, b)
+            assert abs(a.dot(b) - ref) < 1e-12 * abs(ref)
+            assert abs(b.dot(a) - ref) < 1e-12 * abs(ref)
+
+    check()
+    u.scale(-2.)
+    check()
+    u.axpy(0.5, v)
+    check()
+    v.plus(w)
+    check()
+    w.set(u)
+    check()
+    w.axpy(1., w)
+    check()
+    u.vec_wo().setRandom(rand)
+    check()
+
+
+def test_dual_cache_writers():
+    """ Check that restrict, riesz_map and derivative invalidate the
+    cached dual of the vector they write to."""
+
+    mesh = fd.UnitSquareMesh(5, 5)
+    Q = fs.FeMultiGridControlSpace(mesh, refinements=1)
+    inner = fs.H1InnerProduct(Q)
+    rand = PETSc.Random().create(mesh.comm)
+    u = fs.ControlVector(Q, inner)
+    v = fs.ControlVector(Q, inner)
+    v.vec_wo().setRandom(rand)
+
+    def check():
+        ref = inner.eval(u, u)
+        assert abs(u.dot(u) - ref) < 1e-12 * abs(ref)
+
+    u.vec_wo().setRandom(rand)
+    u.get_dual()
+    residual = fd.Function(Q.V_r)
+    with residual.dat.vec_wo as r:
+        r.setRandom(rand)
+    Q.restrict(residual, u)
+    check()
+    u.get_dual()
+    inner.riesz_map(v, u)
+    check()
+    u.get_dual()
+    J = fsz.CoarseDeformationRegularization(Q, l2_reg=1., scale=2.)
+    q = fs.ControlVector(Q, inner)
+    q.vec_wo().setRandom(rand)
+    J.update(q, None, -1)
+    J.derivative(u)
+    check()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -1,4 +1,5 @@
 import unittest
+import pytest
 import firedrake as fd
 import fireshape as fs
 import fireshape.zoo as fsz
@@ -67,5 +68,84 @@ def test_equality_constraint(pytestconfig):
     assert (state.cnorm < 1e-6)
 
 
+def test_equality_constraint_cache():
+    """ Check that the gradients are computed once per iterate."""
+    mesh = fd.UnitSquareMesh(10, 10)
+    Q = fs.FeControlSpace(mesh)
+    inner = fs.ElasticityInnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+
+    class CountingFunctional(fsz.LevelsetFunctional):
+        num_gradients = 0
+
+        def gradient(self, g, x, tol):
+            CountingFunctional.num_gradients += 1
+            super().gradient(g, x, tol)
+
+    (x, y) = fd.SpatialCoordinate(Q.mesh_m)
+    c = [CountingFunctional(fd.Constant(1.0), Q),
+         CountingFunctional(x, Q)]
+    e = fs.EqualityConstraint(c)
+    e.update(q, None, -1)
+    v = q.clone()
+    v.fun.interpolate(fd.SpatialCoordinate(mesh))
+    v.mark_modified()
+    jv = ROL.StdVector(2)
+    ajv = q.clone()
+    for _ in range(3):
+        e.applyJacobian(jv, v, q, None)
+        e.applyAdjointJacobian(ajv, jv, q, None)
+        # updating with the same iterate keeps the gradients
+        e.update(q, None, -1)
+    assert CountingFunctional.num_gradients == 2
+
+    # the adjoint Jacobian is the transpose of the Jacobian
+    g = q.clone()
+    ref = q.clone()
+    for i in range(2):
+        c[i].gradient(g, q, None)
+        ref.axpy(jv[i], g)
+    ref.axpy(-1., ajv)
+    assert ref.norm() < 1e-12 * ajv.norm()
+
+    # moving the domain invalidates the gradients
+    q.fun.interpolate(0.1 * fd.SpatialCoordinate(mesh))
+    q.mark_modified()
+    e.update(q, None, -1)
+    e.applyJacobian(jv, v, q, None)
+    assert CountingFunctional.num_gradients == 6
+
+
+@pytest.mark.parametrize("direct_solve", [False, True])
+def test_equality_constraint_batched(direct_solve):
+    """ Check that batched evaluation agrees with the one by one."""
+    mesh = fd.UnitSquareMesh(10, 10)
+    Q = fs.FeControlSpace(mesh)
+    inner = fs.ElasticityInnerProduct(Q, direct_solve=direct_solve)
+    q = fs.ControlVector(Q, inner)
+    q.fun.interpolate(0.1 * fd.SpatialCoordinate(mesh))
+    q.mark_modified()
+
+    (x, y) = fd.SpatialCoordinate(Q.mesh_m)
+    c = [fsz.LevelsetFunctional(fd.Constant(1.0), Q),
+         fsz.LevelsetFunctional(x, Q),
+         fsz.LevelsetFunctional(y * y, Q, scale=2.)]
+    e1 = fs.EqualityConstraint(c, target_value=[0., 0., 0.])
+    e2 = fs.EqualityConstraint(c, target_value=[0., 0., 0.], batched=True)
+    assert e2.batched
+    e1.update(q, None, -1)
+    e2.update(q, None, -1)
+
+    (v1, v2) = (ROL.StdVector(3), ROL.StdVector(3))
+    e1.value(v1, q, None)
+    e2.value(v2, q, None)
+    for i in range(3):
+        assert abs(v1[i] - v2[i]) < 1e-12 * abs(v1[i])
+
+    for (g1, g2) in zip(e1.get_gradients(q, None), e2.get_gradients(q, None)):
+        g2.axpy(-1., g1)
+        assert g2.norm() < 1e-8 * g1.norm()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,47 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+import fireshape.zoo as fsz
+
+
+def test_form_cache():
+    """ Check that cached forms follow changes of the domain and of
+    coefficients, and that mark_dirty rebuilds them."""
+
+    mesh = fd.UnitSquareMesh(10, 10)
+    Q = fs.FeControlSpace(mesh)
+    inner = fs.H1InnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+
+    (x, y) = fd.SpatialCoordinate(Q.mesh_m)
+    c = fd.Constant(1.)
+    J = fsz.LevelsetFunctional(c * (x**2 + y**2 - 0.5), Q)
+    J_ref = fsz.LevelsetFunctional(c * (x**2 + y**2 - 0.5), Q)
+    J_ref.cache_forms = False
+    g = q.clone()
+    g_ref = q.clone()
+
+    def check():
+        assert abs(J.value(q, None) - J_ref.value(q, None)) < 1e-14
+        J.gradient(g, q, None)
+        J_ref.gradient(g_ref, q, None)
+        g.axpy(-1., g_ref)
+        assert g.norm() < 1e-12 * g_ref.norm()
+
+    form = J.get_value_form()
+    check()
+    q.vec_wo().set(0.1)
+    J.update(q, None, 1)
+    check()
+    c.assign(2.)
+    check()
+    assert J.get_value_form() is form
+
+    J.f = x - y
+    J_ref.f = x - y
+    J.mark_dirty()
+    check()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,40 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+from firedrake.petsc import PETSc
+
+
+@pytest.mark.parametrize("inner_t", [fs.H1InnerProduct,
+                                     fs.ElasticityInnerProduct])
+def test_inexact_riesz_map(inner_t):
+    """ Check that a loose tolerance requested by ROL yields a cheaper and
+    less accurate Riesz map if inexact=True."""
+
+    mesh = fd.UnitSquareMesh(20, 20)
+    Q = fs.FeControlSpace(mesh)
+    inner = inner_t(Q, fixed_bids=[1], inexact=True)
+
+    v = fs.ControlVector(Q, inner)
+    rand = PETSc.Random().create(mesh.comm)
+    v.vec_wo().setRandom(rand)
+    exact = v.clone()
+    approx = v.clone()
+
+    v.set_tolerance(1e-20)
+    inner.riesz_map(v, exact)
+    its_exact = inner.ls.ksp.getIterationNumber()
+    v.set_tolerance(1e-3)
+    inner.riesz_map(v, approx)
+    its_approx = inner.ls.ksp.getIterationNumber()
+
+    assert its_approx < its_exact
+    approx.axpy(-1., exact)
+    assert approx.norm() < 1e-1 * exact.norm()
+
+    # tol=None restores the exact Riesz map
+    v.set_tolerance(None)
+    assert inner.ls.ksp.getTolerances()[0] == inner.params["ksp_rtol"]
+
+
+if __name__ == '__main__':
+    pytest.main()
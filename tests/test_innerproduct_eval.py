@@ -0,0 +1,77 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+from firedrake.petsc import PETSc
+
+
+def setup_vectors(make_controlspace, controlspace_t, inner_t):
+    """Return an inner product and two random ControlVectors."""
+    if controlspace_t == fs.BsplineControlSpace \
+            and inner_t == fs.SurfaceInnerProduct:
+        pytest.skip("SurfaceInnerProduct requires a FE control space.")
+    mesh = fd.UnitSquareMesh(5, 5)
+    Q = make_controlspace(controlspace_t, mesh)
+    inner = inner_t(Q)
+    u = fs.ControlVector(Q, inner)
+    v = fs.ControlVector(Q, inner)
+    rand = PETSc.Random().create(mesh.comm)
+    u.vec_wo().setRandom(rand)
+    v.vec_wo().setRandom(rand)
+    return (inner, u, v)
+
+
+@pytest.mark.parametrize("controlspace_t", [fs.FeControlSpace,
+                                            fs.BsplineControlSpace])
+@pytest.mark.parametrize("inner_t", [fs.H1InnerProduct,
+                                     fs.SurfaceInnerProduct])
+def test_innerproduct_eval(controlspace_t, inner_t, make_controlspace):
+    """ Check eval_norm and that the Riesz map can be applied in place."""
+
+    (inner, u, v) = setup_vectors(make_controlspace, controlspace_t, inner_t)
+    for i in range(2):
+        assert abs(u.norm() - inner.eval(u, u)**0.5) < 1e-12 * u.norm()
+
+    out = u.clone()
+    inner.riesz_map(v, out)
+    v.apply_riesz_map()
+    v.axpy(-1., out)
+    assert v.norm() < 1e-10 * out.norm()
+
+
+def num_petsc_objects():
+    """Number of PETSc objects created so far (plus one for the probe)."""
+    # every new PETSc object gets the next id
+    probe = PETSc.Vec().createSeq(1, comm=PETSc.COMM_SELF)
+    n = probe.getId()
+    probe.destroy()
+    return n
+
+
+@pytest.mark.parametrize("controlspace_t", [fs.FeControlSpace,
+                                            fs.BsplineControlSpace])
+@pytest.mark.parametrize("inner_t", [fs.H1InnerProduct,
+                                     fs.SurfaceInnerProduct])
+def test_innerproduct_no_allocation(controlspace_t, inner_t,
+                                    make_controlspace):
+    """ Check that eval, apply and riesz_map create no PETSc objects."""
+
+    (inner, u, v) = setup_vectors(make_controlspace, controlspace_t, inner_t)
+    out = u.clone()
+    outvec = out.vec_wo()
+
+    def run():
+        inner.eval(u, v)
+        inner.eval_norm(u)
+        inner.apply(u, outvec)
+        inner.riesz_map(v, out)
+
+    # warm-up
+    run()
+    n = num_petsc_objects()
+    for i in range(3):
+        run()
+    assert num_petsc_objects() == n + 1
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,51 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+import fireshape.zoo as fsz
+
+
+@pytest.mark.parametrize("inner_t", [fs.H1InnerProduct,
+                                     fs.ElasticityInnerProduct])
+@pytest.mark.parametrize("controlspace_t", [fs.FeControlSpace,
+                                            fs.BsplineControlSpace])
+def test_lbfgs(inner_t, controlspace_t, make_controlspace):
+    """ Solve the levelset test case with fs.LBFGSSolver."""
+
+    Q = make_controlspace(controlspace_t, fs.DiskMesh(0.1),
+                          bbox=[(-2, 2), (-2, 2)], levels=[4, 4])
+    inner = inner_t(Q)
+    q = fs.ControlVector(Q, inner)
+
+    (x, y) = fd.SpatialCoordinate(Q.mesh_m)
+    f = (pow(x, 2))+pow(1.3*y, 2) - 1.
+    J = fsz.LevelsetFunctional(f, Q, scale=0.1)
+
+    grad_tol = 1e-6
+    params_dict = {
+        'General': {
+            'Secant': {
+                'Type': 'Limited-Memory BFGS',
+                'Maximum Storage': 50
+            }
+        },
+        'Step': {
+            'Type': 'Line Search',
+            'Line Search': {
+                'Descent Method': {
+                    'Type': 'Quasi-Newton Step'
+                }
+            }
+        },
+        'Status Test': {
+            'Gradient Tolerance': grad_tol,
+            'Step Tolerance': 1e-10,
+            'Iteration Limit': 150
+        }
+    }
+    solver = fs.LBFGSSolver(J, q, params_dict)
+    solver.solve()
+    assert solver.gnorm < grad_tol
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,41 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+from firedrake.petsc import PETSc
+
+
+@pytest.mark.parametrize("inner_t", [fs.H1InnerProduct,
+                                     fs.LaplaceInnerProduct,
+                                     fs.ElasticityInnerProduct])
+@pytest.mark.parametrize("direct_solve", [False, True])
+def test_matfree_innerproduct(inner_t, direct_solve):
+    """ Compare matrix-free and assembled inner products."""
+
+    mesh = fd.UnitSquareMesh(4, 4)
+    Q = fs.FeMultiGridControlSpace(mesh, refinements=1, order=2)
+    inner_aij = inner_t(Q, fixed_bids=[1], direct_solve=direct_solve)
+    inner_mf = inner_t(Q, fixed_bids=[1], direct_solve=direct_solve,
+                       mat_type="matfree")
+
+    u = fs.ControlVector(Q, inner_aij)
+    v = fs.ControlVector(Q, inner_aij)
+    rand = PETSc.Random().create(mesh.comm)
+    u.vec_wo().setRandom(rand)
+    v.vec_wo().setRandom(rand)
+    ref = inner_aij.eval(u, v)
+    assert abs(inner_mf.eval(u, v) - ref) < 1e-10 * abs(ref)
+
+    out_aij = fs.ControlVector(Q, inner_aij)
+    out_mf = fs.ControlVector(Q, inner_mf)
+    inner_aij.riesz_map(v, out_aij)
+    inner_mf.riesz_map(v, out_mf)
+    out_mf.axpy(-1., out_aij)
+    assert out_mf.norm() < 1e-8 * out_aij.norm()
+
+    # only the P1 operator is assembled for the preconditioner
+    pc = inner_mf.ls.ksp.pc.getPythonContext()
+    assert isinstance(pc, fd.P1PC)
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,43 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+from firedrake.petsc import PETSc
+
+
+@pytest.mark.parametrize("inner_t", [fs.H1InnerProduct,
+                                     fs.LaplaceInnerProduct,
+                                     fs.ElasticityInnerProduct])
+@pytest.mark.parametrize("fixed_bids", [[], [1, 2]])
+def test_multigrid_riesz(inner_t, fixed_bids):
+    """ Compare the Riesz map solved with geometric multigrid with the
+    Riesz map solved with a direct solver."""
+
+    if inner_t is not fs.H1InnerProduct and len(fixed_bids) == 0:
+        pytest.skip("The Riesz map is only unique up to the nullspace.")
+    mesh = fd.UnitSquareMesh(4, 4)
+    Q = fs.FeMultiGridControlSpace(mesh, refinements=2, control_level=2)
+    inner_mg = inner_t(Q, fixed_bids=fixed_bids, multigrid=True)
+    inner_lu = inner_t(Q, fixed_bids=fixed_bids, direct_solve=True)
+
+    v = fs.ControlVector(Q, inner_mg)
+    rand = PETSc.Random().create(mesh.comm)
+    v.vec_wo().setRandom(rand)
+    out_mg = fs.ControlVector(Q, inner_mg)
+    out_lu = fs.ControlVector(Q, inner_lu)
+    inner_mg.riesz_map(v, out_mg)
+    inner_lu.riesz_map(v, out_lu)
+    assert inner_mg.Aksp.getIterationNumber() < 20
+    out_mg.vec_wo().axpy(-1., out_lu.vec_ro())
+    assert out_mg.norm() < 1e-8 * out_lu.norm()
+
+
+def test_multigrid_riesz_requires_coarse_level():
+    """ Check that multigrid is refused without a coarser level."""
+    mesh = fd.UnitSquareMesh(4, 4)
+    Q = fs.FeMultiGridControlSpace(mesh, refinements=1)
+    with pytest.raises(ValueError):
+        fs.H1InnerProduct(Q, multigrid=True)
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,51 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+from firedrake.petsc import PETSc
+
+
+@pytest.mark.parametrize("order", [1, 2])
+@pytest.mark.parametrize("refinements", [1, 3])
+def test_multigrid_transfer(order, refinements):
+    """ Compare the prolongation matrix of fs.FeMultiGridControlSpace
+    with firedrake's prolong and restrict."""
+
+    mesh = fd.UnitSquareMesh(3, 3)
+    Q = fs.FeMultiGridControlSpace(mesh, refinements=refinements,
+                                   order=order)
+    inner = fs.H1InnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+    rand = PETSc.Random().create(mesh.comm)
+    rand.setInterval((-1, 1))
+    q.vec_wo().setRandom(rand)
+
+    # prolong level by level
+    element = Q.V_r_coarse.ufl_element()
+    Tc = q.fun
+    for mesh_f in Q.mesh_hierarchy[1:]:
+        Tf = fd.Function(fd.FunctionSpace(mesh_f, element))
+        fd.prolong(Tc, Tf)
+        Tc = Tf
+    T = fd.Function(Q.V_r)
+    Q.interpolate(q, T)
+    assert fd.norm(T) > 0
+    assert fd.errornorm(Tc, T) < 1e-12 * fd.norm(T)
+
+    # restrict level by level
+    residual = fd.Function(Q.V_r)
+    with residual.dat.vec_wo as r:
+        r.setRandom(rand)
+    Rf = residual
+    for mesh_c in reversed(Q.mesh_hierarchy[:-1]):
+        Rc = fd.Function(fd.FunctionSpace(mesh_c, element))
+        fd.restrict(Rf, Rc)
+        Rf = Rc
+    g = q.clone()
+    Q.restrict(residual, g)
+    with Rf.dat.vec_ro as expected:
+        g.vec_wo().axpy(-1., expected)
+        assert g.vec_ro().norm() < 1e-12 * expected.norm()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,81 @@
+import pytest
+import firedrake as fd
+import fireshape as fs
+from firedrake.petsc import PETSc
+
+
+def test_operator_cache(tmpdir):
+    """ Build control space and inner product twice with an
+    fs.OperatorCache and check that the reloaded operators coincide."""
+
+    mesh = fd.UnitSquareMesh(5, 5)
+    bbox = [(-1, 2), (-1, 2)]
+    orders = [3, 3]
+    levels = [3, 3]
+    cache = fs.OperatorCache(str(tmpdir))
+
+    def build():
+        Q = fs.BsplineControlSpace(mesh, bbox, orders, levels, cache=cache)
+        inner = fs.ElasticityInnerProduct(Q, fixed_bids=[1], cache=cache)
+        return Q, inner
+
+    Q1, inner1 = build()
+    files = tmpdir.listdir(sort=True)
+    assert len(files) > 0
+    mtimes = [f.mtime() for f in files]
+
+    # the second build loads all operators and stores none
+    calls = {"store": 0, "hits": 0}
+    (store, load_mat, load_vec) = (cache.store, cache.load_mat,
+                                   cache.load_vec)
+
+    def counting_store(*args):
+        calls["store"] += 1
+        store(*args)
+
+    def counting_load_mat(*args):
+        A = load_mat(*args)
+        calls["hits"] += A is not None
+        return A
+
+    def counting_load_vec(*args):
+        found = load_vec(*args)
+        calls["hits"] += found
+        return found
+
+    cache.store = counting_store
+    cache.load_mat = counting_load_mat
+    cache.load_vec = counting_load_vec
+    Q2, inner2 = build()
+    assert calls["store"] == 0
+    assert calls["hits"] > 0
+    assert tmpdir.listdir(sort=True) == files
+    assert [f.mtime() for f in files] == mtimes
+
+    rand = PETSc.Random().create(mesh.comm)
+    rand.setInterval((-1, 1))
+    q1 = fs.ControlVector(Q1, inner1)
+    q1.vec_wo().setRandom(rand)
+    q2 = fs.ControlVector(Q2, inner2)
+    q2.set(q1)
+
+    # interpolation matrices
+    T1 = fd.Function(Q1.V_r)
+    T2 = fd.Function(Q2.V_r)
+    Q1.interpolate(q1, T1)
+    Q2.interpolate(q2, T2)
+    assert fd.norm(T1) > 0
+    assert fd.errornorm(T1, T2) < 1e-14
+
+    # inner products
+    assert abs(q1.norm() - q2.norm()) < 1e-12 * q1.norm()
+
+    # a different mesh must not reuse the cached operators
+    cache_key = Q1.cache_key
+    mesh.coordinates.dat.data[:, 0] += 0.1
+    Q3 = fs.BsplineControlSpace(mesh, bbox, orders, levels, cache=cache)
+    assert Q3.cache_key != cache_key
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,75 @@
+import importlib.util
+import pytest
+import firedrake as fd
+import fireshape as fs
+from fireshape import ShapeObjective
+from fireshape import PdeConstraint
+
+
+class HeatSolver(PdeConstraint):
+    """Heat equation with implicit Euler time stepping."""
+    def __init__(self, mesh_m, num_timesteps=8):
+        super().__init__()
+        self.num_timesteps = num_timesteps
+        self.V = fd.FunctionSpace(mesh_m, "CG", 1)
+        self.solution = fd.Function(self.V, name="State")
+        self.u_old = fd.Function(self.V)
+
+        u = self.solution
+        v = fd.TestFunction(self.V)
+        dt = fd.Constant(0.1)
+        self.F = (fd.inner(fd.grad(u), fd.grad(v)) - 4. * v) * fd.dx \
+            + (u - self.u_old) * v / dt * fd.dx
+        self.bcs = fd.DirichletBC(self.V, 0., "on_boundary")
+        problem = fd.NonlinearVariationalProblem(self.F, self.solution,
+                                                 bcs=self.bcs)
+        self.solver = fd.NonlinearVariationalSolver(
+            problem, solver_parameters={"ksp_type": "preonly",
+                                        "pc_type": "lu"})
+
+    def solve(self):
+        super().solve()
+        self.u_old.assign(0.)
+        for _ in self.timesteps():
+            self.solver.solve()
+            self.u_old.assign(self.solution)
+
+
+class FinalTimeObjective(ShapeObjective):
+    """L2 tracking of the state at the final time."""
+    def __init__(self, pde_solver: HeatSolver, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pde_solver = pde_solver
+
+    def value_form(self):
+        return (self.pde_solver.solution - 0.1)**2 * fd.dx
+
+
+@pytest.mark.skipif(importlib.util.find_spec("checkpoint_schedules") is None,
+                    reason="requires checkpoint_schedules")
+@pytest.mark.parametrize("checkpoints", [1, 3])
+def test_tape_checkpointing(checkpoints):
+    """ Check that checkpointing does not change the gradient."""
+
+    def gradient(**kwargs):
+        mesh = fd.UnitSquareMesh(10, 10)
+        Q = fs.FeControlSpace(mesh)
+        inner = fs.ElasticityInnerProduct(Q)
+        q = fs.ControlVector(Q, inner)
+        X = fd.SpatialCoordinate(mesh)
+        q.fun.interpolate(0.1 * fd.as_vector([X[1] * X[1], X[0] * X[1]]))
+        e = HeatSolver(Q.mesh_m)
+        J = fs.ReducedObjective(FinalTimeObjective(e, Q), e, **kwargs)
+        J.update(q, None, -1)
+        g = q.clone()
+        J.gradient(g, q, None)
+        return (J.value(q, None), g.vec_ro().copy())
+
+    (val1, g1) = gradient()
+    (val2, g2) = gradient(checkpoints=checkpoints)
+    assert abs(val2 - val1) < 1e-12 * abs(val1)
+    assert (g2 - g1).norm() < 1e-10 * g1.norm()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,33 @@
+import firedrake as fd
+import fireshape as fs
+import pytest
+
+
+def test_update_domain():
+    """ Check that update_domain only moves the mesh for new controls."""
+
+    mesh = fd.UnitSquareMesh(5, 5)
+    Q = fs.FeControlSpace(mesh)
+    inner = fs.LaplaceInnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+
+    assert Q.update_domain(q)
+    assert not Q.update_domain(q)
+
+    q.vec_wo().set(0.1)
+    assert Q.update_domain(q)
+    assert abs(Q.T.dat.data_ro - Q.id.dat.data_ro - 0.1).max() < 1e-14
+
+    # a copy has the same content, so the domain is not updated
+    p = q.clone()
+    p.set(q)
+    assert not Q.update_domain(p)
+
+    p.scale(2.)
+    assert Q.update_domain(p)
+    q.axpy(1., q)
+    assert Q.update_domain(q)
+
+
+if __name__ == '__main__':
+    pytest.main()
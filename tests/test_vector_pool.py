@@ -0,0 +1,35 @@
+import pytest
+import gc
+import firedrake as fd
+import fireshape as fs
+
+
+@pytest.mark.parametrize("controlspace_t", [fs.FeControlSpace,
+                                            fs.BsplineControlSpace])
+def test_vector_pool(controlspace_t, make_controlspace):
+    """ Check that clones of ControlVectors recycle their data."""
+
+    Q = make_controlspace(controlspace_t, fd.UnitSquareMesh(5, 5))
+    inner = fs.H1InnerProduct(Q)
+    q = fs.ControlVector(Q, inner)
+    pool = Q.get_vector_pool()
+
+    a = q.clone()
+    b = q.clone()
+    assert pool.stats() == {"hits": 0, "misses": 2, "live": 2, "peak": 2}
+    a.vec_wo().set(1.)
+    data = a.data
+    del a
+    gc.collect()
+    assert pool.stats()["live"] == 1
+
+    # the recycled data is zeroed
+    c = q.clone()
+    assert c.data is data
+    assert c.vec_ro().norm() == 0
+    assert pool.stats() == {"hits": 1, "misses": 2, "live": 2, "peak": 2}
+    del b, c
+
+
+if __name__ == '__main__':
+    pytest.main()